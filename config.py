@@ -16,6 +16,8 @@ class Config:
     # SMTP配置（用于发送邮件）
     SMTP_SERVER = os.getenv('SMTP_SERVER', 'mail.sjtu.edu.cn')  # 默认为学校邮箱SMTP服务器
     SMTP_PORT = int(os.getenv('SMTP_PORT', 465))  # 默认为学校邮箱SMTP端口
+    SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', 5))  # 同一账号最多同时保持的SMTP连接数
+    SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', 100))  # 单条SMTP连接发送该数量的邮件后重建
     
     # Qwen API配置 (用于embedding)
     QWEN_API_KEY = os.getenv('QWEN_API_KEY')
@@ -28,18 +30,57 @@ class Config:
     # 模型配置
     LLM_MODEL = os.getenv('LLM_MODEL', 'gemini-2.5-pro')  # 默认模型
     LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')  # gemini, qwen
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 10))  # 批量处理时同时进行的LLM请求数量
+    LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', 5))  # 单次LLM请求中合并分析的邮件数量
+    LLM_BATCH_MAX_TOKENS = int(os.getenv('LLM_BATCH_MAX_TOKENS', 12000))  # 合并分析时单次请求的邮件内容token上限
+    HTML_PROCESS_POOL_MIN_SIZE = int(os.getenv('HTML_PROCESS_POOL_MIN_SIZE', 200000))  # HTML正文达到该字符数时在进程池中解析，0表示不使用进程池
+    HTML_PROCESS_POOL_WORKERS = int(os.getenv('HTML_PROCESS_POOL_WORKERS', 2))  # 解析HTML的进程数
+    MAX_PROMPT_TOKENS = int(os.getenv('MAX_PROMPT_TOKENS', 4000))  # 单封邮件分析提示的token上限，超出的邮件内容会被截断
+    LLM_JSON_MODE = os.getenv('LLM_JSON_MODE', 'true').lower() == 'true'  # 是否要求模型以JSON模式返回（需要服务端支持response_format）
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', './data/llm_cache')  # LLM分析结果缓存目录，留空则只使用进程内缓存
+    LLM_CACHE_TTL_DAYS = int(os.getenv('LLM_CACHE_TTL_DAYS', 30))  # LLM分析结果缓存有效期（天）
+    LLM_RPM = int(os.getenv('LLM_RPM', 60))  # LLM服务每分钟请求数上限，0表示不限速
+    LLM_TPM = int(os.getenv('LLM_TPM', 100000))  # LLM服务每分钟token数上限，0表示不限速
     
     # Embedding配置
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'Qwen/Qwen3-Embedding-8B')  # 默认embedding模型
     EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'qwen')  # qwen
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 10))  # 每次embedding请求的文本数量，DashScope上限为10
+    EMBEDDING_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', 4))  # 同时进行的embedding请求数量
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', './data/embedding_cache')  # 文档embedding缓存目录，留空则只缓存查询向量
     
     # 向量数据库配置
     VECTOR_DB_PATH = os.getenv('VECTOR_DB_PATH', './vector_db')
+    RAG_SPLIT_PROCESS_MIN_EMAILS = int(os.getenv('RAG_SPLIT_PROCESS_MIN_EMAILS', 1000))  # 一次写入的邮件数达到该值时在进程池中分割文本，0表示不使用进程池
+    RAG_SPLIT_PROCESS_WORKERS = int(os.getenv('RAG_SPLIT_PROCESS_WORKERS', os.cpu_count() or 2))  # 分割文本的进程数
+    RAG_SPLIT_CACHE_PATH = os.getenv('RAG_SPLIT_CACHE_PATH', './data/split_cache')  # 文本分割结果缓存目录，留空则不缓存
+    VECTOR_INDEX_IVF_THRESHOLD = int(os.getenv('VECTOR_INDEX_IVF_THRESHOLD', 10000))  # 重建时向量数达到该值改用IVF+PQ索引，0表示始终使用精确索引
+    VECTOR_INDEX_NLIST = int(os.getenv('VECTOR_INDEX_NLIST', 100))  # IVF聚类中心数量
+    VECTOR_INDEX_PQ_M = int(os.getenv('VECTOR_INDEX_PQ_M', 8))  # PQ子向量数量，需能整除embedding维度
+    VECTOR_INDEX_NPROBE = int(os.getenv('VECTOR_INDEX_NPROBE', 8))  # 查询时搜索的IVF聚类数量
+    VECTOR_INDEX_FP16 = os.getenv('VECTOR_INDEX_FP16', 'true').lower() == 'true'  # 暴力检索索引是否以fp16保存向量
+    VECTOR_INDEX_USE_GPU = os.getenv('VECTOR_INDEX_USE_GPU', 'true').lower() == 'true'  # 安装faiss-gpu且有CUDA设备时在GPU上检索
     
     
     # 邮件检查间隔（秒）
     EMAIL_CHECK_INTERVAL = int(os.getenv('EMAIL_CHECK_INTERVAL', 300))
     
+    # IMAP连接保活间隔（秒），两次轮询之间定期发送NOOP
+    IMAP_KEEPALIVE_INTERVAL = int(os.getenv('IMAP_KEEPALIVE_INTERVAL', 300))
+    
+    # 是否使用IMAP IDLE接收新邮件推送（服务器不支持时自动回退到轮询）
+    IMAP_USE_IDLE = os.getenv('IMAP_USE_IDLE', 'true').lower() == 'true'
+    
+    # 并行接收大量邮件时使用的IMAP连接数
+    IMAP_FETCH_WORKERS = int(os.getenv('IMAP_FETCH_WORKERS', 4))
+    
+    # 已处理邮件的最大UID记录文件，重启后从该UID之后继续获取新邮件
+    IMAP_STATE_PATH = os.getenv('IMAP_STATE_PATH', './data/imap_state.json')
+    
+    # 断路器配置：LLM或SMTP连续失败达到次数后，在指定时间（秒）内跳过调用
+    CIRCUIT_BREAKER_FAIL_MAX = int(os.getenv('CIRCUIT_BREAKER_FAIL_MAX', 5))
+    CIRCUIT_BREAKER_RESET_TIMEOUT = int(os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT', 60))
+    
     # 重要通知提醒配置
     NOTIFICATION_EMAIL = os.getenv('NOTIFICATION_EMAIL')
     NOTIFICATION_SMTP_SERVER = os.getenv('NOTIFICATION_SMTP_SERVER', SMTP_SERVER)  # 默认使用主SMTP服务器
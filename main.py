@@ -6,20 +6,16 @@
 import os
 import sys
 import logging
+import queue
 import threading
 import time
 from datetime import datetime
-from pathlib import Path
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from config import Config
-from src.services.email_receiver import EmailReceiver
-from src.services.email_processor import EmailProcessor
-from src.services.rag_service import RAGService
-from src.services.notification_service import NotificationService
-from src.services.school_email_client import SchoolEmailClient
+from src.utils.http_clients import close_http_client
 
 # 设置日志
 logging.basicConfig(
@@ -35,6 +31,15 @@ logger = logging.getLogger(__name__)
 class EmailManagementSystem:
     """邮箱管理系统主类"""
     
+    # 系统运行所需的数据目录
+    DATA_DIRECTORIES = (Config.VECTOR_DB_PATH, './logs', './data')
+    
+    # 相同内容的通知在该时间窗口（秒）内只发送一次
+    NOTIFICATION_DEDUP_WINDOW = 60
+    
+    # 停止系统时等待邮件检查线程退出的最长时间（秒），正在处理的一批邮件可能需要等待LLM响应
+    SHUTDOWN_TIMEOUT = 60
+    
     def __init__(self):
         """初始化邮箱管理系统"""
         logger.info("初始化邮箱管理系统")
@@ -47,7 +52,13 @@ class EmailManagementSystem:
             logger.error(f"配置验证失败: {str(e)}")
             sys.exit(1)
         
-        # 初始化服务
+        # 初始化服务（在此处导入，避免仅加载本模块时就引入LangChain、FAISS等重量级依赖）
+        from src.services.email_receiver import EmailReceiver
+        from src.services.email_processor import EmailProcessor
+        from src.services.rag_service import RAGService
+        from src.services.notification_service import NotificationService
+        from src.services.school_email_client import SchoolEmailClient
+        
         self.email_receiver = EmailReceiver()
         self.email_processor = EmailProcessor()
         self.rag_service = RAGService()
@@ -57,6 +68,15 @@ class EmailManagementSystem:
         # 控制变量
         self.running = False
         self.email_check_thread = None
+        # 停止信号：唤醒邮件检查线程中的IDLE等待和轮询间隔
+        self._stop_event = threading.Event()
+        
+        # 通知队列：由后台线程发送通知，SMTP耗时不会阻塞邮件检查循环
+        self._notify_queue = queue.Queue(maxsize=1024)
+        self._recent_notifications = {}
+        self._notify_thread = threading.Thread(target=self._notify_worker)
+        self._notify_thread.daemon = True
+        self._notify_thread.start()
         
         # 创建数据目录
         self._create_data_directories()
@@ -65,43 +85,64 @@ class EmailManagementSystem:
     
     def _create_data_directories(self):
         """创建必要的数据目录"""
-        directories = [
-            Config.VECTOR_DB_PATH,
-            './logs',
-            './data'
-        ]
-        
-        for directory in directories:
-            Path(directory).mkdir(parents=True, exist_ok=True)
-            logger.info(f"创建目录: {directory}")
+        for directory in self.DATA_DIRECTORIES:
+            os.makedirs(directory, exist_ok=True)
+        
+        logger.info(f"确保数据目录存在: {', '.join(self.DATA_DIRECTORIES)}")
     
     def start(self):
         """启动邮箱管理系统"""
         logger.info("启动邮箱管理系统")
         
-        # 设置运行标志
+        # 设置运行标志，并清除上次停止时设置的停止信号
         self.running = True
+        self._stop_event.clear()
+        self.email_receiver.resume()
         
         # 启动邮件检查线程
         self.email_check_thread = threading.Thread(target=self._email_check_loop)
         self.email_check_thread.daemon = True
         self.email_check_thread.start()
         
+        # 在两次轮询之间保持IMAP连接
+        self.email_receiver.start_keepalive()
+        
         logger.info("系统启动完成，邮件检查服务已运行")
     
     def stop(self):
         """停止邮箱管理系统"""
         logger.info("停止邮箱管理系统")
         
-        # 设置运行标志
+        # 设置运行标志，并唤醒正在等待的邮件检查线程
         self.running = False
+        self._stop_event.set()
+        self.email_receiver.stop_waiting()
         
-        # 等待邮件检查线程结束
+        # 等待邮件检查线程结束，之后才能断开它正在使用的IMAP连接
         if self.email_check_thread and self.email_check_thread.is_alive():
-            self.email_check_thread.join(timeout=5)
+            self.email_check_thread.join(timeout=self.SHUTDOWN_TIMEOUT)
+        check_thread_alive = self.email_check_thread is not None and self.email_check_thread.is_alive()
         
-        # 断开邮件接收器连接
-        self.email_receiver.disconnect()
+        # 停止保活并断开邮件接收器连接（仅在系统停止时断开）
+        if check_thread_alive:
+            logger.warning("邮件检查线程未能及时退出，跳过断开IMAP连接")
+            self.email_receiver.stop_keepalive()
+        else:
+            self.email_receiver.disconnect()
+        
+        # 保存向量数据库中尚未写入磁盘的邮件，并关闭分割文本的进程池
+        self.rag_service.close()
+        
+        # 释放邮件处理器的进程池和事件循环，并关闭共享的HTTP连接池；
+        # 事件循环在邮件检查线程中运行，只能在该线程退出后关闭
+        if not check_thread_alive:
+            self.email_processor.close()
+        close_http_client()
+        
+        # 发送完队列中剩余的通知后停止通知线程
+        self._notify_queue.put(None)
+        self._notify_thread.join(timeout=30)
+        self.notification_service.close()
         
         logger.info("邮箱管理系统已停止")
     
@@ -111,11 +152,15 @@ class EmailManagementSystem:
         
         while self.running:
             try:
-                # 检查新邮件
-                self._check_and_process_emails()
+                # 复用已有IMAP连接，仅在连接失效时重连
+                if self.email_receiver.ensure_connected():
+                    # 检查新邮件
+                    self._check_and_process_emails()
+                else:
+                    logger.warning("IMAP连接不可用，跳过本次检查")
                 
-                # 等待下一次检查
-                time.sleep(Config.EMAIL_CHECK_INTERVAL)
+                # 等待新邮件推送或下一次检查
+                self._wait_for_next_check()
                 
             except KeyboardInterrupt:
                 logger.info("收到中断信号，停止邮件检查")
@@ -123,15 +168,64 @@ class EmailManagementSystem:
             except Exception as e:
                 logger.error(f"邮件检查循环出错: {str(e)}")
                 # 发送错误通知
-                self.notification_service.send_error_notification(
+                self._queue_error_notification(
                     f"邮件检查循环出错: {str(e)}",
                     {"time": datetime.now().isoformat()}
                 )
                 # 等待一段时间后继续
-                time.sleep(60)
+                self._stop_event.wait(60)
         
         logger.info("邮件检查循环已停止")
     
+    def _queue_error_notification(self, error_message: str, context: dict = None):
+        """将错误通知放入队列，由后台线程发送；时间窗口内重复的通知会被合并"""
+        now = time.monotonic()
+        
+        # 清理过期的去重记录
+        self._recent_notifications = {
+            key: sent_at for key, sent_at in self._recent_notifications.items()
+            if now - sent_at < self.NOTIFICATION_DEDUP_WINDOW
+        }
+        
+        key = hash(error_message)
+        if key in self._recent_notifications:
+            logger.info("相同的错误通知刚刚发送过，跳过")
+            return
+        self._recent_notifications[key] = now
+        
+        try:
+            self._notify_queue.put_nowait(('error', error_message, context))
+        except queue.Full:
+            logger.warning("通知队列已满，丢弃错误通知")
+    
+    def _notify_worker(self):
+        """通知发送线程"""
+        senders = {
+            'error': self.notification_service.send_error_notification,
+        }
+        
+        while True:
+            item = self._notify_queue.get()
+            if item is None:
+                break
+            
+            kind, message, context = item
+            try:
+                senders[kind](message, context)
+            except Exception as e:
+                logger.error(f"发送通知时出错: {str(e)}")
+    
+    def _wait_for_next_check(self):
+        """等待下一次检查：优先使用IMAP IDLE由服务器推送新邮件，EMAIL_CHECK_INTERVAL作为兜底轮询间隔"""
+        if Config.IMAP_USE_IDLE:
+            has_new_email = self.email_receiver.wait_for_new_emails(timeout=Config.EMAIL_CHECK_INTERVAL)
+            if has_new_email is not None:
+                if has_new_email:
+                    logger.info("收到新邮件推送")
+                return
+        
+        self._stop_event.wait(Config.EMAIL_CHECK_INTERVAL)
+    
     def _check_and_process_emails(self):
         """检查并处理新邮件"""
         try:
@@ -152,22 +246,21 @@ class EmailManagementSystem:
             # 添加到RAG系统
             self.rag_service.add_emails_to_vector_store(processed_emails)
             
-            # 检查重要邮件并发送通知
-            important_emails = [
-                email for email in processed_emails 
+            # 检查重要邮件并发送通知（单次遍历，通知服务按批次流式处理）
+            important_emails = (
+                email for email in processed_emails
                 if email.importance == 'high'
-            ]
-            
-            if important_emails:
-                logger.info(f"发现 {len(important_emails)} 封重要邮件")
-                self.notification_service.send_batch_important_email_notification(important_emails)
+            )
+            notified_count = self.notification_service.send_batch_important_email_notification(important_emails)
+            if notified_count:
+                logger.info(f"已发送 {notified_count} 封重要邮件的通知")
             
             logger.info(f"邮件处理完成，共处理 {len(processed_emails)} 封邮件")
             
         except Exception as e:
             logger.error(f"检查并处理邮件时出错: {str(e)}")
             # 发送错误通知
-            self.notification_service.send_error_notification(
+            self._queue_error_notification(
                 f"检查并处理邮件时出错: {str(e)}",
                 {"time": datetime.now().isoformat()}
             )
@@ -180,9 +273,9 @@ class EmailManagementSystem:
         try:
             # 测试邮件接收
             logger.info("测试邮件接收功能")
-            if self.email_receiver.connect():
+            # 复用（或建立）IMAP连接而不断开，邮件检查循环会继续使用该连接
+            if self.email_receiver.ping():
                 logger.info("邮件接收功能测试成功")
-                self.email_receiver.disconnect()
             else:
                 logger.error("邮件接收功能测试失败")
             
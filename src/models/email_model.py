@@ -1,12 +1,52 @@
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any, Tuple
 from dataclasses import dataclass, field
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from email.errors import HeaderParseError
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+from email import policy
+from email.utils import getaddresses, parsedate_to_datetime
+from functools import cached_property, lru_cache
 import base64
 import re
 
+# 邮箱地址正则，模块加载时编译一次
+_EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+
+# 快速解析邮件头部用的正则：常用头部字段及其折叠的续行
+_HEADER_RE = re.compile(rb'^(Subject|From|Date|To|Cc):[ \t]*(.*(?:\r?\n[ \t].*)*)', re.MULTILINE | re.IGNORECASE)
+_HEADER_FOLD_RE = re.compile(rb'\r?\n(?=[ \t])')
+
+# 头部的结束位置（第一个空行）
+_HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+
+
+@lru_cache(maxsize=4096)
+def _decode_header_value(header_str: str) -> str:
+    """解码RFC 2047编码的邮件头部，结果按原始字符串缓存（同一线程中的发件人、主题经常重复）"""
+    # 没有RFC 2047编码字（=?charset?encoding?text?=）的头部无需解码，这是最常见的情况
+    if '=?' not in header_str:
+        return header_str
+    
+    try:
+        decoded_parts = decode_header(header_str)
+        result = []
+        for part, encoding in decoded_parts:
+            if isinstance(part, bytes):
+                if encoding:
+                    result.append(part.decode(encoding))
+                else:
+                    result.append(part.decode('utf-8', errors='ignore'))
+            else:
+                result.append(str(part))
+        return ''.join(result)
+    except (HeaderParseError, UnicodeDecodeError, LookupError):
+        return header_str
+
+
 @dataclass
 class EmailAttachment:
     """邮件附件数据模型"""
@@ -38,6 +78,28 @@ class Email:
     category: Optional[str] = None
     summary: Optional[str] = None
     key_info: Optional[Dict[str, Any]] = None
+    # 只获取了头部的邮件用于按需获取 (正文, HTML正文, 附件)，获取后置为None
+    body_loader: Optional[Callable[[], Tuple[str, Optional[str], List[EmailAttachment]]]] = field(
+        default=None, repr=False, compare=False
+    )
+    
+    @cached_property
+    def date_str(self) -> str:
+        """格式化的邮件日期（精确到秒），首次访问时计算并缓存"""
+        return self.date.strftime('%Y-%m-%d %H:%M:%S')
+    
+    @cached_property
+    def short_date_str(self) -> str:
+        """格式化的邮件日期（精确到分钟），用于通知内容"""
+        return self.date_str[:16]
+    
+    @property
+    def lazy_body(self) -> str:
+        """邮件正文；只获取了头部的邮件在首次访问时才获取正文和附件"""
+        if self.body_loader is not None:
+            loader, self.body_loader = self.body_loader, None
+            self.body, self.html_body, self.attachments = loader()
+        return self.body
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
@@ -59,6 +121,16 @@ class Email:
     @classmethod
     def from_mime_message(cls, msg_id: str, mime_msg: MIMEMultipart) -> 'Email':
         """从MIME消息创建Email对象"""
+        email_obj = cls.from_headers(msg_id, mime_msg)
+        
+        # 单次遍历MIME结构，同时解析正文和附件
+        email_obj.body, email_obj.html_body, email_obj.attachments = cls._extract_parts(mime_msg)
+        return email_obj
+    
+    @classmethod
+    def from_headers(cls, msg_id: str, mime_msg: MIMEMultipart,
+                     body_loader: Optional[Callable[[], Tuple[str, Optional[str], List[EmailAttachment]]]] = None) -> 'Email':
+        """只根据邮件头部创建Email对象，正文为空，可通过body_loader在访问lazy_body时获取"""
         # 解析发件人
         sender = cls._extract_email_address(mime_msg['From'])
         
@@ -76,33 +148,66 @@ class Email:
         # 解析主题
         subject = cls._decode_header(mime_msg['Subject'])
         
-        # 解析正文
-        body, html_body = cls._extract_body(mime_msg)
-        
-        # 解析附件
-        attachments = cls._extract_attachments(mime_msg)
-        
         return cls(
             id=msg_id,
             subject=subject,
             sender=sender,
             recipients=recipients,
             date=date,
-            body=body,
-            html_body=html_body,
-            attachments=attachments
+            body="",
+            body_loader=body_loader
         )
     
+    @classmethod
+    def from_header_bytes(cls, msg_id: str, raw_header: bytes,
+                          body_loader: Optional[Callable[[], Tuple[str, Optional[str], List[EmailAttachment]]]] = None) -> 'Email':
+        """
+        从原始头部字节创建Email对象（正文为空）
+        
+        常见的ASCII/UTF-8头部直接用正则提取Subject、From、Date、To、Cc；
+        头部含RFC 2047编码字、非UTF-8字节或缺少必要字段时，回退到email包的完整头部解析
+        """
+        # 扫描整个头部（Received、DKIM等字段常使To、Cc位于数KB之后），遇到空行即停止，不扫描可能附带的正文
+        header_end = _HEADER_END_RE.search(raw_header)
+        header_block = raw_header[:header_end.start()] if header_end else raw_header
+        
+        headers = {}
+        for match in _HEADER_RE.finditer(header_block):
+            headers.setdefault(match.group(1).lower(), match.group(2))
+        
+        if all(name in headers for name in (b'subject', b'from', b'date')) and \
+                not any(b'=?' in value for value in headers.values()):
+            try:
+                fields = {name.decode('ascii'): _HEADER_FOLD_RE.sub(b'', value).decode('utf-8').strip()
+                          for name, value in headers.items()}
+            except UnicodeDecodeError:
+                fields = None
+            
+            if fields is not None:
+                recipients = cls._extract_email_addresses(fields.get('to', ''))
+                recipients.extend(cls._extract_email_addresses(fields.get('cc', '')))
+                return cls(
+                    id=msg_id,
+                    subject=fields['subject'],
+                    sender=cls._extract_email_address(fields['from']),
+                    recipients=recipients,
+                    date=cls._parse_date(fields['date']),
+                    body="",
+                    body_loader=body_loader
+                )
+        
+        header_message = BytesHeaderParser(policy=policy.default).parsebytes(raw_header)
+        return cls.from_headers(msg_id, header_message, body_loader=body_loader)
+    
     @staticmethod
     def _extract_email_address(address_str: str) -> str:
         """从地址字符串中提取邮箱地址"""
         if not address_str:
             return ""
         
-        # 使用正则表达式提取邮箱地址
-        email_pattern = r'[\w\.-]+@[\w\.-]+\.\w+'
-        match = re.search(email_pattern, address_str)
-        return match.group() if match else address_str
+        # 使用预编译的正则表达式提取邮箱地址
+        match = _EMAIL_RE.search(address_str)
+        return match.group(0) if match else address_str
     
     @staticmethod
     def _extract_email_addresses(addresses_str: str) -> List[str]:
@@ -110,9 +215,13 @@ class Email:
         if not addresses_str:
             return []
         
-        # 分割地址并提取每个地址
-        addresses = addresses_str.split(',')
-        return [Email._extract_email_address(addr.strip()) for addr in addresses]
+        # 使用标准库的RFC 5322地址解析，能正确处理显示名中的逗号
+        addresses = [address for _, address in getaddresses([str(addresses_str)]) if address]
+        if addresses:
+            return addresses
+        
+        # 无法按RFC解析时，回退到按逗号分割并逐个提取
+        return [Email._extract_email_address(addr.strip()) for addr in addresses_str.split(',')]
     
     @staticmethod
     def _decode_header(header_str: str) -> str:
@@ -120,22 +229,8 @@ class Email:
         if not header_str:
             return ""
         
-        # 简单的头部解码，实际可能需要更复杂的处理
-        try:
-            from email.header import decode_header
-            decoded_parts = decode_header(header_str)
-            result = []
-            for part, encoding in decoded_parts:
-                if isinstance(part, bytes):
-                    if encoding:
-                        result.append(part.decode(encoding))
-                    else:
-                        result.append(part.decode('utf-8', errors='ignore'))
-                else:
-                    result.append(str(part))
-            return ''.join(result)
-        except:
-            return header_str
+        # 使用policy.default解析的邮件头已是解码后的字符串，这里统一转为str后走缓存
+        return _decode_header_value(str(header_str))
     
     @staticmethod
     def _parse_date(date_str: str) -> datetime:
@@ -144,64 +239,47 @@ class Email:
             return datetime.now()
         
         try:
-            from email.utils import parsedate_to_datetime
-            return parsedate_to_datetime(date_str)
-        except:
+            return parsedate_to_datetime(str(date_str))
+        except (TypeError, ValueError):
             return datetime.now()
     
-    @staticmethod
-    def _extract_body(mime_msg: MIMEMultipart) -> tuple[str, Optional[str]]:
-        """提取邮件正文"""
+    @classmethod
+    def _extract_parts(cls, mime_msg: MIMEMultipart) -> Tuple[str, Optional[str], List[EmailAttachment]]:
+        """单次遍历MIME结构，提取纯文本正文、HTML正文和附件"""
         body = ""
         html_body = None
+        attachments = []
         
-        if mime_msg.is_multipart():
-            for part in mime_msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get('Content-Disposition', ''))
-                
-                # 跳过附件
-                if 'attachment' in content_disposition:
-                    continue
-                
-                if content_type == 'text/plain':
-                    payload = part.get_payload(decode=True)
-                    charset = part.get_content_charset() or 'utf-8'
-                    body = payload.decode(charset, errors='ignore')
-                elif content_type == 'text/html':
-                    payload = part.get_payload(decode=True)
-                    charset = part.get_content_charset() or 'utf-8'
-                    html_body = payload.decode(charset, errors='ignore')
-        else:
+        if not mime_msg.is_multipart():
             # 单部分邮件
-            payload = mime_msg.get_payload(decode=True)
+            payload = mime_msg.get_payload(decode=True) or b''
             charset = mime_msg.get_content_charset() or 'utf-8'
-            body = payload.decode(charset, errors='ignore')
+            return payload.decode(charset, errors='ignore'), html_body, attachments
         
-        return body, html_body
-    
-    @staticmethod
-    def _extract_attachments(mime_msg: MIMEMultipart) -> List[EmailAttachment]:
-        """提取邮件附件"""
-        attachments = []
+        for part in mime_msg.walk():
+            content_disposition = str(part.get('Content-Disposition', ''))
+            
+            if 'attachment' in content_disposition:
+                # 附件：只处理带文件名的部分
+                filename = part.get_filename()
+                if filename:
+                    content = part.get_payload(decode=True)
+                    attachments.append(EmailAttachment(
+                        filename=cls._decode_header(filename),
+                        content_type=part.get_content_type(),
+                        size=len(content),
+                        content=content
+                    ))
+                continue
+            
+            content_type = part.get_content_type()
+            if content_type == 'text/plain':
+                payload = part.get_payload(decode=True)
+                charset = part.get_content_charset() or 'utf-8'
+                body = payload.decode(charset, errors='ignore')
+            elif content_type == 'text/html':
+                payload = part.get_payload(decode=True)
+                charset = part.get_content_charset() or 'utf-8'
+                html_body = payload.decode(charset, errors='ignore')
         
-        if mime_msg.is_multipart():
-            for part in mime_msg.walk():
-                content_disposition = str(part.get('Content-Disposition', ''))
-                
-                if 'attachment' in content_disposition:
-                    filename = part.get_filename()
-                    if filename:
-                        filename = Email._decode_header(filename)
-                        content_type = part.get_content_type()
-                        content = part.get_payload(decode=True)
-                        size = len(content)
-                        
-                        attachments.append(EmailAttachment(
-                            filename=filename,
-                            content_type=content_type,
-                            size=size,
-                            content=content
-                        ))
-        
-        return attachments
\ No newline at end of file
+        return body, html_body, attachments
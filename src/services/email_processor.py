@@ -1,19 +1,136 @@
+import asyncio
+import hashlib
 import logging
-import json
 import re
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.messages import HumanMessage
+from json_repair import repair_json
+import tiktoken
 
 from config import Config
 from src.models.email_model import Email
+from src.utils.circuit_breaker import CircuitBreaker, CircuitBreakerOpenError
+from src.utils.http_clients import aclose_async_http_client, get_async_http_client, get_http_client
+from src.utils.process_pool import create_process_pool
+from src.utils.rate_limiter import get_llm_rate_limiter
+from src.utils.retry import aretry_call, retry_call
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # 未安装selectolax时使用BeautifulSoup解析HTML
+    HTMLParser = None
+
+try:
+    import diskcache
+except ImportError:  # 未安装diskcache时只使用进程内缓存
+    diskcache = None
+
+try:
+    import re2
+except ImportError:  # 未安装google-re2时使用标准库re
+    re2 = None
 
 logger = logging.getLogger(__name__)
 
+# 进程内缓存的LLM分析结果数量
+LLM_MEMORY_CACHE_SIZE = 1024
+
+# 内容清理使用的正则表达式，模块加载时编译一次
+_RE_BLANK_LINES = re.compile(r'\n\s*\n')
+_RE_WS = re.compile(r'\s+')
+_RE_PHRASE_SEP = re.compile(r' {2,}')
+
+# 常见的邮件签名的起始标记
+_SIGNATURE_MARKERS = (
+    r'--\s*\n',  # 标准签名
+    r'Best regards,',  # 英文祝福语
+    r'此致',  # 中文祝福语
+    r'发自我的',  # 移动设备签名
+)
+
+# 转发信息的起始标记
+_FORWARD_MARKERS = (
+    r'-----Original Message-----',
+    r'----- 转发的邮件 -----',
+    r'From:',
+)
+
+# 签名和转发信息合并为一个正则，单次扫描即可全部移除：从起始标记删除到下一个空行或文本结尾。
+# 安装了google-re2时使用RE2（DFA，匹配时间与文本长度呈线性）；RE2不支持前瞻断言，
+# 因此改为捕获结尾的空行并在替换时保留
+_JUNK_MARKERS = '(?:' + '|'.join(_SIGNATURE_MARKERS + _FORWARD_MARKERS) + ')'
+if re2 is not None:
+    _JUNK_RE = re2.compile(r'(?s)' + _JUNK_MARKERS + r'.*?(\n\n|$)')
+    _JUNK_REPL = r'\1'
+else:
+    _JUNK_RE = re.compile(r'(?s)' + _JUNK_MARKERS + r'.*?(?=\n\n|$)')
+    _JUNK_REPL = ''
+
+# 提示模板本身（字段说明等）预留的token数
+PROMPT_TEMPLATE_TOKENS = 500
+
+# LLM分析结果必须包含的字段
+REQUIRED_ANALYSIS_KEYS = ('summary', 'importance')
+
+# LLM服务不可用（断路器打开）时使用的默认分析结果，保证后续流程继续进行
+DEFAULT_ANALYSIS = {'summary': '', 'importance': 'medium', 'category': 'other'}
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """加载tiktoken编码器（首次使用时加载并缓存），加载失败时返回None"""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"加载tiktoken编码器失败，按字符数估算token: {str(e)}")
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    """计算文本的token数，编码器不可用时按每个字符1个token保守估算（中文通常如此）"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到不超过max_tokens个token"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens]
+    
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+# 邮件分析结果字段说明，单封和批量分析模板共用
+ANALYSIS_FIELDS = """- summary: 邮件内容的简短总结（100-200字）
+- key_points: 邮件中的关键要点列表
+- action_items: 需要采取的行动项列表（如果有）
+- important_dates: 重要日期列表（如果有）
+- contacts: 相关联系人列表（如果有）
+- importance: 重要性级别
+   - "high": 重要（如学校老师通知、工作重要事项、紧急事务等）
+   - "medium": 次重要（如社区通知、一般工作邮件等）
+   - "low": 不重要（如广告、软件更新、推广邮件等）
+- category: 邮件类别
+   - "work": 工作相关
+   - "education": 教育相关
+   - "community": 社区相关
+   - "advertisement": 广告推广
+   - "notification": 系统通知
+   - "personal": 个人邮件
+   - "other": 其他
+"""
+
 class EmailProcessor:
     """邮件处理服务类，用于总结邮件内容、提取关键信息、判别重要性等"""
     
@@ -22,6 +139,9 @@ class EmailProcessor:
         # 根据配置选择LLM提供商
         provider = Config.LLM_PROVIDER.lower()
         
+        # JSON模式：要求服务端只返回合法的JSON对象（OpenAI兼容接口的response_format参数）
+        model_kwargs = {"response_format": {"type": "json_object"}} if Config.LLM_JSON_MODE else {}
+        
         if provider == 'gemini':
             if not Config.GEMINI_API_KEY:
                 raise ValueError("使用Gemini LLM时必须设置GEMINI_API_KEY")
@@ -30,7 +150,10 @@ class EmailProcessor:
                 openai_api_key=Config.GEMINI_API_KEY,
                 openai_api_base=Config.GEMINI_API_BASE,
                 temperature=0.1,
-                model_name=Config.LLM_MODEL
+                model_name=Config.LLM_MODEL,
+                model_kwargs=model_kwargs,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client()
             )
         elif provider == 'qwen':
             if not Config.QWEN_API_KEY:
@@ -40,73 +163,77 @@ class EmailProcessor:
                 openai_api_key=Config.QWEN_API_KEY,
                 openai_api_base=Config.QWEN_API_BASE,
                 temperature=0.1,
-                model_name=Config.LLM_MODEL
+                model_name=Config.LLM_MODEL,
+                model_kwargs=model_kwargs,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client()
             )
         else:
             raise ValueError(f"不支持的LLM提供商: {provider}，请使用 'gemini' 或 'qwen'")
         
-        # 文本分割器，用于处理长邮件
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=200,
-            length_function=len
+        # 批量处理使用的事件循环，首次批处理时创建
+        self._loop = None
+        
+        # LLM断路器：服务持续故障时快速失败，不再逐封邮件重试
+        self._llm_breaker = CircuitBreaker(
+            'LLM',
+            fail_max=Config.CIRCUIT_BREAKER_FAIL_MAX,
+            reset_timeout=Config.CIRCUIT_BREAKER_RESET_TIMEOUT
         )
         
+        # LLM请求限速器（RPM/TPM），进程内所有LLM调用共用
+        self._rate_limiter = get_llm_rate_limiter()
+        
+        # 解析大HTML正文的进程池，避免CPU密集的解析占用GIL阻塞事件循环中的LLM请求；
+        # 启动时创建一次，子进程在首次使用时启动
+        self._cpu_pool = (
+            create_process_pool(Config.HTML_PROCESS_POOL_WORKERS)
+            if Config.HTML_PROCESS_POOL_MIN_SIZE > 0 else None
+        )
+        
+        # LLM分析结果缓存（按邮件内容哈希），转发、重发的相同邮件不再重复调用LLM
+        self._memory_cache = OrderedDict()
+        self._disk_cache = self._open_llm_cache()
+        
         # 初始化提示模板
         self._init_prompt_templates()
     
     def _init_prompt_templates(self):
         """初始化各种提示模板"""
-        # 邮件总结模板
-        self.summary_prompt = PromptTemplate(
-            input_variables=["email_content"],
+        # 邮件分析模板：一次调用同时完成总结、关键信息提取和重要性判别
+        self.analysis_prompt = PromptTemplate(
+            input_variables=["email_content", "sender", "subject"],
             template="""
-请对以下邮件内容进行总结，提取关键信息，并以JSON格式返回结果。JSON应包含以下字段：
-- summary: 邮件内容的简短总结（100-200字）
-- key_points: 邮件中的关键要点列表
-- action_items: 需要采取的行动项列表（如果有）
-- important_dates: 重要日期列表（如果有）
-- contacts: 相关联系人列表（如果有）
+请对以下邮件进行分析：总结邮件内容、提取关键信息，并判别邮件的重要性和类别，以JSON格式返回结果。
 
+邮件主题：{subject}
+发件人：{sender}
 邮件内容：
 {email_content}
 
+JSON应包含以下字段：
+""" + ANALYSIS_FIELDS + """
 请返回有效的JSON格式结果：
 """
         )
         
-        # 邮件重要性判别模板
-        self.importance_prompt = PromptTemplate(
-            input_variables=["email_content", "sender", "subject"],
+        # 多封邮件批量分析模板：一次调用分析多封邮件，减少请求次数
+        self.batch_analysis_prompt = PromptTemplate(
+            input_variables=["emails", "count"],
             template="""
-请根据以下邮件信息，判别邮件的重要性和类别，并以JSON格式返回结果。
+请对以下{count}封邮件逐一进行分析：总结邮件内容、提取关键信息，并判别邮件的重要性和类别。
 
-邮件主题：{subject}
-发件人：{sender}
-邮件内容：{email_content}
+{emails}
 
-请根据以下标准判别：
-1. 重要性级别（importance）：
-   - "high": 重要（如学校老师通知、工作重要事项、紧急事务等）
-   - "medium": 次重要（如社区通知、一般工作邮件等）
-   - "low": 不重要（如广告、软件更新、推广邮件等）
-
-2. 邮件类别（category）：
-   - "work": 工作相关
-   - "education": 教育相关
-   - "community": 社区相关
-   - "advertisement": 广告推广
-   - "notification": 系统通知
-   - "personal": 个人邮件
-   - "other": 其他
-
-请返回有效的JSON格式结果，包含importance和category字段：
+请以JSON对象格式返回结果，对象的results字段为包含{count}个对象的数组，按邮件编号顺序排列，每个对象包含以下字段：
+""" + ANALYSIS_FIELDS + """
+请返回有效的JSON对象，格式为 {{"results": [...]}}：
 """
         )
         
         # 创建可运行的链（使用新的LCEL语法）
-        self.summary_chain = self.summary_prompt | self.llm
-        self.importance_chain = self.importance_prompt | self.llm
+        self.analysis_chain = self.analysis_prompt | self.llm
+        self.batch_analysis_chain = self.batch_analysis_prompt | self.llm
     
     def process_email(self, email: Email) -> Email:
         """处理邮件，包括总结、提取关键信息、判别重要性等"""
@@ -116,22 +243,10 @@ class EmailProcessor:
             # 准备邮件内容
             email_content = self._prepare_email_content(email)
             
-            # 总结邮件内容并提取关键信息
-            summary_result = self._summarize_email(email_content)
-            if summary_result:
-                email.summary = summary_result.get('summary', '')
-                email.key_info = {
-                    'key_points': summary_result.get('key_points', []),
-                    'action_items': summary_result.get('action_items', []),
-                    'important_dates': summary_result.get('important_dates', []),
-                    'contacts': summary_result.get('contacts', [])
-                }
+            # 总结邮件内容、提取关键信息并判别重要性和类别
+            analysis_result = self._analyze_email(email_content, email.sender, email.subject)
             
-            # 判别邮件重要性和类别
-            importance_result = self._classify_importance(email_content, email.sender, email.subject)
-            if importance_result:
-                email.importance = importance_result.get('importance', 'medium')
-                email.category = importance_result.get('category', 'other')
+            self._apply_analysis(email, analysis_result)
             
             logger.info(f"邮件处理完成: {email.subject}")
             return email
@@ -140,169 +255,478 @@ class EmailProcessor:
             logger.error(f"处理邮件时出错: {str(e)}")
             return email
     
-    def _prepare_email_content(self, email: Email) -> str:
-        """准备邮件内容，去除不必要的格式和噪音"""
-        # 合并主题和正文
-        content = f"主题: {email.subject}\n\n"
-        
-        # 添加发件人和收件人信息
-        content += f"发件人: {email.sender}\n"
-        content += f"收件人: {', '.join(email.recipients)}\n"
-        content += f"日期: {email.date.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+    async def aprocess_email(self, email: Email) -> Email:
+        """异步处理邮件"""
+        try:
+            logger.info(f"开始处理邮件: {email.subject}")
+            
+            # 准备邮件内容（大HTML正文在进程池中解析）
+            bodies = await self._aextract_html_bodies([email])
+            email_content = self._prepare_email_content(email, bodies[0])
+            
+            analysis_result = await self._aanalyze_email(email_content, email.sender, email.subject)
+            
+            self._apply_analysis(email, analysis_result)
+            
+            logger.info(f"邮件处理完成: {email.subject}")
+            return email
+            
+        except Exception as e:
+            logger.error(f"处理邮件时出错: {str(e)}")
+            return email
+    
+    def _apply_analysis(self, email: Email, analysis_result: Optional[Dict[str, Any]]):
+        """将LLM分析结果写回邮件对象"""
+        if not analysis_result:
+            return
         
-        # 添加正文内容
-        if email.html_body:
+        email.summary = analysis_result.get('summary', '')
+        email.key_info = {
+            'key_points': analysis_result.get('key_points', []),
+            'action_items': analysis_result.get('action_items', []),
+            'important_dates': analysis_result.get('important_dates', []),
+            'contacts': analysis_result.get('contacts', [])
+        }
+        email.importance = analysis_result.get('importance', 'medium')
+        email.category = analysis_result.get('category', 'other')
+    
+    def _prepare_email_content(self, email: Email, body: Optional[str] = None) -> str:
+        """准备邮件内容，去除不必要的格式和噪音；body为已提取的正文文本（为None时在此提取）"""
+        if body is None:
             # 如果有HTML正文，尝试提取纯文本
-            content += self._extract_text_from_html(email.html_body)
-        else:
-            content += email.body
+            body = self._extract_text_from_html(email.html_body) if email.html_body else email.body
         
-        # 清理内容
-        content = self._clean_content(content)
+        # 合并主题、发件人和收件人信息以及正文
+        parts = [
+            f"主题: {email.subject}",
+            "",
+            f"发件人: {email.sender}",
+            f"收件人: {', '.join(email.recipients)}",
+            f"日期: {email.date_str}",
+            "",
+            body
+        ]
         
-        return content
+        # 清理内容
+        return self._clean_content("\n".join(parts))
     
-    def _extract_text_from_html(self, html_content: str) -> str:
-        """从HTML内容中提取纯文本"""
+    @staticmethod
+    def _extract_text_from_html(html_content: str) -> str:
+        """从HTML内容中提取纯文本（静态方法，可在进程池中执行）"""
         try:
-            from bs4 import BeautifulSoup
-            
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # 移除脚本和样式
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # 获取文本
-            text = soup.get_text(separator='\n')
-            
-            # 清理文本
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
+            if HTMLParser is not None:
+                try:
+                    text = EmailProcessor._html_to_text_selectolax(html_content)
+                except Exception as e:
+                    logger.warning(f"selectolax解析HTML失败，回退到BeautifulSoup: {str(e)}")
+                    text = EmailProcessor._html_to_text_bs4(html_content)
+            else:
+                text = EmailProcessor._html_to_text_bs4(html_content)
             
-            return text
+            # 清理文本：去掉每行首尾空白，并按连续空格拆分短语
+            phrases = (phrase.strip() for line in text.splitlines() for phrase in _RE_PHRASE_SEP.split(line))
+            return '\n'.join(phrase for phrase in phrases if phrase)
         except Exception as e:
             logger.error(f"从HTML提取文本时出错: {str(e)}")
             return html_content
     
+    @staticmethod
+    def _html_to_text_selectolax(html_content: str) -> str:
+        """使用selectolax（C实现的HTML解析器）提取文本"""
+        tree = HTMLParser(html_content)
+        
+        # 移除脚本和样式
+        for tag in tree.css('script, style'):
+            tag.decompose()
+        
+        node = tree.body if tree.body is not None else tree.root
+        if node is None:
+            return ''
+        return node.text(separator='\n')
+    
+    @staticmethod
+    def _html_to_text_bs4(html_content: str) -> str:
+        """使用BeautifulSoup提取文本"""
+        from bs4 import BeautifulSoup
+        
+        soup = BeautifulSoup(html_content, 'html.parser')
+        
+        # 移除脚本和样式
+        for script in soup(["script", "style"]):
+            script.decompose()
+        
+        return soup.get_text(separator='\n')
+    
+    async def _aextract_html_bodies(self, emails: List[Email]) -> List[Optional[str]]:
+        """
+        在进程池中提取大HTML正文的纯文本
+        
+        只有HTML正文不小于HTML_PROCESS_POOL_MIN_SIZE的邮件会交给进程池（小正文的进程间传输开销大于解析本身），
+        其余邮件对应位置返回None，由_prepare_email_content就地提取
+        """
+        bodies = [None] * len(emails)
+        if self._cpu_pool is None:
+            return bodies
+        
+        indexes = [
+            index for index, email in enumerate(emails)
+            if email.html_body and len(email.html_body) >= Config.HTML_PROCESS_POOL_MIN_SIZE
+        ]
+        if not indexes:
+            return bodies
+        
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self._cpu_pool, EmailProcessor._extract_text_from_html, emails[index].html_body)
+            for index in indexes
+        ], return_exceptions=True)
+        
+        for index, result in zip(indexes, results):
+            if isinstance(result, Exception):
+                logger.error(f"在进程池中提取HTML文本时出错: {str(result)}")
+            else:
+                bodies[index] = result
+        
+        return bodies
+    
+    def close(self):
+        """
+        释放批量处理使用的进程池、事件循环及其上的异步HTTP连接
+        
+        事件循环属于调用batch_process_emails的线程，应在该线程不再批量处理后调用；批量处理仍在进行时不做任何释放
+        """
+        if self._loop is not None and self._loop.is_running():
+            logger.warning("批量处理仍在进行，跳过释放事件循环和进程池")
+            return
+        
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=True)
+            self._cpu_pool = None
+        
+        if self._loop is not None and not self._loop.is_closed():
+            # 异步HTTP客户端的连接属于该事件循环，需在关闭循环前释放
+            self._loop.run_until_complete(aclose_async_http_client())
+            self._loop.close()
+        self._loop = None
+    
     def _clean_content(self, content: str) -> str:
         """清理邮件内容，移除不必要的噪音"""
         # 移除多余的换行和空格
-        content = re.sub(r'\n\s*\n', '\n\n', content)
-        content = re.sub(r'\s+', ' ', content)
-        
-        # 移除常见的邮件签名模式
-        signature_patterns = [
-            r'--\s*\n.*?(?=\n\n|$)',  # 标准签名
-            r'Best regards,.*?(?=\n\n|$)',  # 英文祝福语
-            r'此致.*?(?=\n\n|$)',  # 中文祝福语
-            r'发自我的.*?(?=\n\n|$)',  # 移动设备签名
-        ]
+        content = _RE_BLANK_LINES.sub('\n\n', content)
+        content = _RE_WS.sub(' ', content)
         
-        for pattern in signature_patterns:
-            content = re.sub(pattern, '', content, flags=re.DOTALL)
+        # 移除常见的邮件签名和转发信息
+        content = _JUNK_RE.sub(_JUNK_REPL, content)
         
-        # 移除转发信息
-        forward_patterns = [
-            r'-----Original Message-----.*?(?=\n\n|$)',
-            r'----- 转发的邮件 -----.*?(?=\n\n|$)',
-            r'From:.*?(?=\n\n|$)',
-        ]
+        return content.strip()
+    
+    def _truncate_content(self, email_content: str) -> str:
+        """按token预算截断过长的邮件内容，为提示模板预留PROMPT_TEMPLATE_TOKENS个token"""
+        return _truncate_to_tokens(email_content, Config.MAX_PROMPT_TOKENS - PROMPT_TEMPLATE_TOKENS)
+    
+    def _analysis_input(self, email_content: str, sender: str, subject: str) -> Dict[str, str]:
+        """准备邮件分析用的输入"""
+        return {
+            "email_content": self._truncate_content(email_content),
+            "sender": sender,
+            "subject": subject
+        }
+    
+    def _batch_analysis_input(self, emails: List[Email], contents: List[str]) -> Dict[str, Any]:
+        """准备多封邮件批量分析用的输入，每封邮件按编号分段"""
+        sections = []
+        for index, (email, content) in enumerate(zip(emails, contents), 1):
+            sections.append(
+                f"邮件 {index}：\n"
+                f"邮件主题：{email.subject}\n"
+                f"发件人：{email.sender}\n"
+                f"邮件内容：\n{content}"
+            )
         
-        for pattern in forward_patterns:
-            content = re.sub(pattern, '', content, flags=re.DOTALL)
+        return {
+            "emails": '\n\n'.join(sections),
+            "count": len(emails)
+        }
+    
+    def _group_for_batch(self, items: List[tuple]) -> List[List[tuple]]:
+        """
+        将邮件分组用于批量分析
         
-        return content.strip()
+        每组最多LLM_BATCH_SIZE封邮件，且邮件内容的token数合计不超过LLM_BATCH_MAX_TOKENS
+        """
+        groups = []
+        current = []
+        current_tokens = 0
+        
+        for item in items:
+            # item为（邮件, 内容, 截断后的内容），按截断后实际发送的内容计算token
+            tokens = _count_tokens(item[2])
+            if current and (len(current) >= Config.LLM_BATCH_SIZE or
+                            current_tokens + tokens > Config.LLM_BATCH_MAX_TOKENS):
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            
+            current.append(item)
+            current_tokens += tokens
+        
+        if current:
+            groups.append(current)
+        
+        return groups
     
-    def _summarize_email(self, email_content: str) -> Optional[Dict[str, Any]]:
-        """总结邮件内容并提取关键信息"""
+    def _parse_llm_json(self, result: Any, label: str, required_keys: tuple = ()) -> Optional[Dict[str, Any]]:
+        """
+        从LLM返回结果中解析JSON对象
+        
+        JSON模式下返回内容即为合法JSON；未启用JSON模式时使用json_repair容忍代码块包裹、
+        前后说明文字、尾随逗号、缺失引号等常见格式问题。结果不是对象或缺少required_keys中的字段时返回None
+        """
+        # 提取消息内容
+        if hasattr(result, 'content'):
+            result_text = result.content
+        else:
+            result_text = str(result)
+        
+        data = repair_json(result_text, return_objects=True)
+        if not isinstance(data, dict):
+            logger.error(f"无法解析{label}结果为JSON")
+            return None
+        
+        if not self._has_required_keys([data], required_keys):
+            logger.error(f"{label}结果缺少必要字段: {', '.join(required_keys)}")
+            return None
+        
+        return data
+    
+    @staticmethod
+    def _has_required_keys(items: List[Any], required_keys: tuple) -> bool:
+        """检查每一项都是包含required_keys中所有字段的字典"""
+        return all(isinstance(item, dict) and all(key in item for key in required_keys) for item in items)
+    
+    def _open_llm_cache(self):
+        """打开磁盘上的LLM分析结果缓存，不可用时返回None"""
+        if diskcache is None or not Config.LLM_CACHE_PATH:
+            return None
+        
         try:
-            # 如果邮件内容太长，进行分割
-            if len(email_content) > 4000:
-                chunks = self.text_splitter.split_text(email_content)
-                # 只处理前几个chunk，避免token过多
-                email_content = '\n\n'.join(chunks[:3])
-            
-            # 调用LLM进行总结
-            result = self.summary_chain.invoke({"email_content": email_content})
-            
-            # 提取消息内容
-            if hasattr(result, 'content'):
-                result_text = result.content
-            else:
-                result_text = str(result)
-            
-            # 解析JSON结果
+            return diskcache.Cache(Config.LLM_CACHE_PATH)
+        except Exception as e:
+            logger.error(f"打开LLM结果缓存失败: {str(e)}")
+            return None
+    
+    def _cache_key(self, email_content: str, sender: str, subject: str) -> str:
+        """根据邮件内容和模型生成缓存键"""
+        digest = hashlib.blake2b(
+            '\x00'.join((str(subject), str(sender), email_content)).encode('utf-8'),
+            digest_size=16
+        ).hexdigest()
+        return f"{digest}:{Config.LLM_MODEL}"
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的分析结果，先查进程内缓存再查磁盘缓存"""
+        result = self._memory_cache.get(key)
+        if result is not None:
+            self._memory_cache.move_to_end(key)
+            return result
+        
+        if self._disk_cache is not None:
             try:
-                return json.loads(result_text)
-            except json.JSONDecodeError:
-                # 如果返回的不是有效JSON，尝试提取JSON部分
-                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                if json_match:
-                    try:
-                        return json.loads(json_match.group())
-                    except:
-                        logger.error("无法解析总结结果为JSON")
-                        return None
-                
-                logger.error("总结结果中未找到有效JSON")
+                result = self._disk_cache.get(key)
+            except Exception as e:
+                logger.warning(f"读取LLM结果缓存失败: {str(e)}")
                 return None
-                
+            
+            if result is not None:
+                self._remember(key, result)
+        
+        return result
+    
+    def _cache_set(self, key: str, result: Dict[str, Any]):
+        """缓存分析结果"""
+        self._remember(key, result)
+        
+        if self._disk_cache is not None:
+            try:
+                self._disk_cache.set(key, result, expire=Config.LLM_CACHE_TTL_DAYS * 86400)
+            except Exception as e:
+                logger.warning(f"写入LLM结果缓存失败: {str(e)}")
+    
+    def _remember(self, key: str, result: Dict[str, Any]):
+        """写入进程内LRU缓存"""
+        self._memory_cache[key] = result
+        self._memory_cache.move_to_end(key)
+        if len(self._memory_cache) > LLM_MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+    
+    @staticmethod
+    def _estimate_tokens(inputs: Dict[str, Any]) -> int:
+        """估算一次LLM请求消耗的token数（输入内容加提示模板），用于TPM限速"""
+        return PROMPT_TEMPLATE_TOKENS + sum(_count_tokens(str(value)) for value in inputs.values())
+    
+    def _invoke_chain(self, chain, inputs: Dict[str, Any]) -> Any:
+        """经限速和重试调用LLM链，每次重试同样计入限速"""
+        tokens = self._estimate_tokens(inputs)
+        
+        def _limited_invoke():
+            self._rate_limiter.acquire(tokens)
+            return chain.invoke(inputs)
+        
+        return retry_call(_limited_invoke)
+    
+    async def _ainvoke_chain(self, chain, inputs: Dict[str, Any]) -> Any:
+        """_invoke_chain的异步版本"""
+        tokens = self._estimate_tokens(inputs)
+        
+        async def _limited_ainvoke():
+            await self._rate_limiter.aacquire(tokens)
+            return await chain.ainvoke(inputs)
+        
+        return await aretry_call(_limited_ainvoke)
+    
+    def _analyze_email(self, email_content: str, sender: str, subject: str) -> Optional[Dict[str, Any]]:
+        """总结邮件内容、提取关键信息并判别重要性和类别"""
+        cache_key = self._cache_key(email_content, sender, subject)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            # 调用LLM进行分析
+            result = self._llm_breaker.call(
+                self._invoke_chain, self.analysis_chain, self._analysis_input(email_content, sender, subject)
+            )
+            analysis_result = self._parse_llm_json(result, "分析", required_keys=REQUIRED_ANALYSIS_KEYS)
+            if analysis_result is not None:
+                self._cache_set(cache_key, analysis_result)
+            return analysis_result
+        
+        except CircuitBreakerOpenError as e:
+            logger.warning(f"{str(e)}，使用默认分析结果")
+            return dict(DEFAULT_ANALYSIS)
         except Exception as e:
-            logger.error(f"总结邮件时出错: {str(e)}")
+            logger.error(f"分析邮件时出错: {str(e)}")
             return None
     
-    def _classify_importance(self, email_content: str, sender: str, subject: str) -> Optional[Dict[str, str]]:
-        """判别邮件的重要性和类别"""
+    async def _aanalyze_email(self, email_content: str, sender: str, subject: str) -> Optional[Dict[str, Any]]:
+        """异步总结邮件内容、提取关键信息并判别重要性和类别"""
+        cache_key = self._cache_key(email_content, sender, subject)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            # 如果邮件内容太长，进行截断
-            if len(email_content) > 2000:
-                email_content = email_content[:2000] + "..."
-            
-            # 调用LLM进行分类
-            result = self.importance_chain.invoke({
-                "email_content": email_content,
-                "sender": sender,
-                "subject": subject
-            })
-            
-            # 提取消息内容
-            if hasattr(result, 'content'):
-                result_text = result.content
-            else:
-                result_text = str(result)
-            
-            # 解析JSON结果
-            try:
-                return json.loads(result_text)
-            except json.JSONDecodeError:
-                # 如果返回的不是有效JSON，尝试提取JSON部分
-                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                if json_match:
-                    try:
-                        return json.loads(json_match.group())
-                    except:
-                        logger.error("无法解析分类结果为JSON")
-                        return None
-                
-                logger.error("分类结果中未找到有效JSON")
-                return None
-                
+            result = await self._llm_breaker.acall(
+                self._ainvoke_chain, self.analysis_chain, self._analysis_input(email_content, sender, subject)
+            )
+            analysis_result = self._parse_llm_json(result, "分析", required_keys=REQUIRED_ANALYSIS_KEYS)
+            if analysis_result is not None:
+                self._cache_set(cache_key, analysis_result)
+            return analysis_result
+        
+        except CircuitBreakerOpenError as e:
+            logger.warning(f"{str(e)}，使用默认分析结果")
+            return dict(DEFAULT_ANALYSIS)
         except Exception as e:
-            logger.error(f"判别邮件重要性时出错: {str(e)}")
+            logger.error(f"分析邮件时出错: {str(e)}")
             return None
     
     def batch_process_emails(self, emails: List[Email]) -> List[Email]:
-        """批量处理邮件"""
-        processed_emails = []
+        """批量处理邮件，多封邮件的LLM调用并发进行"""
+        if not emails:
+            return []
+        
+        # 复用同一个事件循环，异步HTTP客户端的连接在多次批处理之间保持有效
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
         
-        for email in emails:
+        return self._loop.run_until_complete(self.abatch_process_emails(emails))
+    
+    async def _aanalyze_email_batch(self, emails: List[Email], contents: List[str]) -> Optional[List[Dict[str, Any]]]:
+        """在一次LLM调用中分析多封邮件，结果无效时返回None"""
+        try:
+            result = await self._llm_breaker.acall(
+                self._ainvoke_chain, self.batch_analysis_chain, self._batch_analysis_input(emails, contents)
+            )
+            data = self._parse_llm_json(result, "批量分析")
+        except Exception as e:
+            logger.error(f"批量分析邮件时出错: {str(e)}")
+            return None
+        
+        if data is None:
+            return None
+        
+        analysis_results = data.get('results')
+        if not isinstance(analysis_results, list) or not self._has_required_keys(analysis_results, REQUIRED_ANALYSIS_KEYS):
+            logger.error(f"批量分析结果缺少必要字段: results, {', '.join(REQUIRED_ANALYSIS_KEYS)}")
+            return None
+        
+        if len(analysis_results) != len(emails):
+            logger.warning(f"批量分析结果与邮件数量不匹配（{len(emails)} 封邮件）")
+            return None
+        
+        return analysis_results
+    
+    async def abatch_process_emails(self, emails: List[Email], max_concurrency: Optional[int] = None) -> List[Email]:
+        """
+        异步批量处理邮件
+        
+        多封邮件合并到同一个提示中分析以减少请求次数，各组请求并发进行，
+        并通过信号量限制同时进行的LLM请求数量；批量结果无效时回退到逐封分析
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or Config.LLM_MAX_CONCURRENCY)
+        
+        async def _analyze_one(email: Email, content: str):
+            async with semaphore:
+                analysis_result = await self._aanalyze_email(content, email.sender, email.subject)
+            self._apply_analysis(email, analysis_result)
+        
+        async def _analyze_group(group: List[tuple]):
+            # 断路器打开时直接逐封处理（使用默认分析结果）
+            if len(group) > 1 and not self._llm_breaker.is_open:
+                group_emails = [email for email, _, _ in group]
+                async with semaphore:
+                    analysis_results = await self._aanalyze_email_batch(
+                        group_emails, [truncated for _, _, truncated in group]
+                    )
+                
+                if analysis_results is not None:
+                    for (email, content, _), analysis_result in zip(group, analysis_results):
+                        self._apply_analysis(email, analysis_result)
+                        self._cache_set(self._cache_key(content, email.sender, email.subject), analysis_result)
+                    logger.info(f"批量分析完成，共 {len(group)} 封邮件")
+                    return
+                
+                logger.info("回退到逐封分析")
+            
+            await asyncio.gather(*[_analyze_one(email, content) for email, content, _ in group])
+        
+        # 命中缓存的邮件直接使用缓存结果，其余邮件按（邮件, 内容, 截断后的内容）分组分析
+        pending = []
+        bodies = await self._aextract_html_bodies(emails)
+        for email, body in zip(emails, bodies):
             try:
-                processed_email = self.process_email(email)
-                processed_emails.append(processed_email)
+                content = self._prepare_email_content(email, body)
             except Exception as e:
-                logger.error(f"批量处理邮件时出错: {str(e)}")
-                processed_emails.append(email)  # 添加未处理的邮件
+                logger.error(f"准备邮件内容时出错: {str(e)}")
+                content = email.body or ''
+            
+            cached = self._cache_get(self._cache_key(content, email.sender, email.subject))
+            if cached is not None:
+                self._apply_analysis(email, cached)
+                continue
+            
+            pending.append((email, content, self._truncate_content(content)))
+        
+        if len(pending) < len(emails):
+            logger.info(f"{len(emails) - len(pending)} 封邮件命中分析缓存")
+        
+        groups = self._group_for_batch(pending)
+        results = await asyncio.gather(*[_analyze_group(group) for group in groups], return_exceptions=True)
+        
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"批量处理邮件时出错: {str(result)}")
         
-        return processed_emails
\ No newline at end of file
+        # 分析结果直接写回邮件对象，未能处理的邮件原样返回
+        return list(emails)
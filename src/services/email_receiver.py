@@ -1,7 +1,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import logging
-import time
+import threading
 
 from config import Config
 from src.models.email_model import Email
@@ -17,18 +17,72 @@ class EmailReceiver:
         self.school_email_client = SchoolEmailClient()
         self.last_check_time = None
         
+        # imaplib连接不是线程安全的，保活线程与轮询共用此锁
+        self._lock = threading.RLock()
+        self._keepalive_thread = None
+        self._keepalive_stop = threading.Event()
+        
+        # 停止信号：设置后正在进行的IDLE等待尽快结束并释放self._lock，之后的等待立即返回
+        self._stop_event = threading.Event()
+        
     def connect(self) -> bool:
         """连接到IMAP服务器"""
+        self.resume()
         return self.school_email_client.connect_imap()
     
     def disconnect(self):
         """断开与IMAP服务器的连接"""
-        self.school_email_client.disconnect_imap()
+        self.stop_waiting()
+        self.stop_keepalive()
+        with self._lock:
+            self.school_email_client.disconnect_imap()
     
     def _ensure_connection(self) -> bool:
         """确保连接有效"""
         return self.school_email_client._ensure_imap_connection()
     
+    def is_connected(self) -> bool:
+        """检查当前IMAP连接是否有效"""
+        return self.school_email_client.is_imap_connected()
+    
+    def ping(self) -> bool:
+        """检查IMAP服务是否可用，优先复用已有连接，连接保持打开供后续轮询使用"""
+        return self.ensure_connected()
+    
+    def ensure_connected(self) -> bool:
+        """确保IMAP连接可用：没有连接时建立连接，已有连接用NOOP校验，失效时重连"""
+        with self._lock:
+            return self._ensure_connection()
+    
+    def start_keepalive(self, interval: int = None):
+        """启动保活线程，在两次轮询之间定期发送NOOP，避免服务器因空闲断开连接"""
+        if self._keepalive_thread and self._keepalive_thread.is_alive():
+            return
+        
+        if interval is None:
+            interval = Config.IMAP_KEEPALIVE_INTERVAL
+        
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, args=(interval,))
+        self._keepalive_thread.daemon = True
+        self._keepalive_thread.start()
+        logger.info(f"IMAP保活线程已启动，间隔: {interval} 秒")
+    
+    def stop_keepalive(self):
+        """停止保活线程"""
+        self._keepalive_stop.set()
+        if self._keepalive_thread and self._keepalive_thread.is_alive():
+            self._keepalive_thread.join(timeout=5)
+        self._keepalive_thread = None
+    
+    def _keepalive_loop(self, interval: int):
+        """保活循环"""
+        while not self._keepalive_stop.wait(interval):
+            with self._lock:
+                if not self.school_email_client.is_imap_connected():
+                    logger.warning("IMAP连接已断开，尝试重新连接")
+                    self._ensure_connection()
+    
     def get_email_folders(self) -> List[str]:
         """获取所有邮件文件夹"""
         return self.school_email_client.get_folders()
@@ -40,7 +94,8 @@ class EmailReceiver:
     
     def get_new_emails(self, folder_name: str = 'INBOX', since: Optional[datetime] = None) -> List[Email]:
         """获取新邮件"""
-        emails = self.school_email_client.get_new_emails(folder_name, since)
+        with self._lock:
+            emails = self.school_email_client.get_new_emails(folder_name, since)
         
         # 更新最后检查时间
         if emails:
@@ -48,6 +103,27 @@ class EmailReceiver:
         
         return emails
     
+    def wait_for_new_emails(self, folder_name: str = 'INBOX', timeout: float = None) -> Optional[bool]:
+        """
+        通过IMAP IDLE阻塞等待新邮件
+        
+        收到新邮件通知返回True，超时返回False；服务器不支持IDLE或出错时返回None，
+        调用方应回退到按固定间隔轮询
+        """
+        if timeout is None:
+            timeout = Config.EMAIL_CHECK_INTERVAL
+        
+        with self._lock:
+            return self.school_email_client.idle_wait(folder_name, timeout, self._stop_event)
+    
+    def stop_waiting(self):
+        """结束正在进行的IDLE等待（不等待其返回），之后的IDLE等待立即返回False"""
+        self._stop_event.set()
+    
+    def resume(self):
+        """清除停止信号，stop_waiting或disconnect之后重新开始检查前调用"""
+        self._stop_event.clear()
+    
     def check_emails_continuously(self, callback=None, folder_name: str = 'INBOX', interval: int = None):
         """持续检查新邮件"""
         if interval is None:
@@ -56,7 +132,10 @@ class EmailReceiver:
         logger.info(f"开始持续检查新邮件，间隔: {interval} 秒")
         
         try:
-            while True:
+            # 建立一次连接，之后的检查和IDLE等待都复用该连接
+            self.ensure_connected()
+            
+            while not self._stop_event.is_set():
                 # 获取新邮件
                 since_time = self.last_check_time if self.last_check_time else datetime.now() - timedelta(minutes=interval//60)
                 new_emails = self.get_new_emails(folder_name, since_time)
@@ -70,8 +149,12 @@ class EmailReceiver:
                             logger.error(f"处理邮件时出错: {str(e)}")
                             continue
                 
-                # 等待下一次检查
-                time.sleep(interval)
+                # 优先通过IMAP IDLE等待服务器推送新邮件，不支持IDLE时按固定间隔轮询
+                has_new_email = self.wait_for_new_emails(folder_name, timeout=interval) if Config.IMAP_USE_IDLE else None
+                if self._stop_event.is_set():
+                    break
+                if has_new_email is None and self._stop_event.wait(interval):
+                    break
         except KeyboardInterrupt:
             logger.info("停止检查新邮件")
         except Exception as e:
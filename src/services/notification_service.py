@@ -1,14 +1,135 @@
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-import json
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Tuple, Callable
+import time
 
 from config import Config
 from src.models.email_model import Email
 from src.services.school_email_client import SchoolEmailClient
+from src.utils.circuit_breaker import CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
+# 每封合并通知邮件最多包含的重要邮件数量
+NOTIFICATION_BATCH_SIZE = 50
+
+# 通知内容缓存的最大条目数
+NOTIFICATION_BODY_CACHE_SIZE = 512
+
+
+# 当前分钟的格式化时间缓存：(分钟序号, 格式化字符串)
+_minute_cache: Tuple[int, str] = (-1, '')
+
+
+def _current_minute_str() -> str:
+    """当前时间格式化为'%Y-%m-%d %H:%M'，同一分钟内的多次调用直接返回缓存的字符串"""
+    global _minute_cache
+    now = time.time()
+    minute = int(now // 60)
+    cached_minute, formatted = _minute_cache
+    if minute != cached_minute:
+        formatted = time.strftime('%Y-%m-%d %H:%M', time.localtime(now))
+        _minute_cache = (minute, formatted)
+    return formatted
+
+
+# 通知邮件统一的结尾说明
+NOTIFICATION_FOOTER = "此邮件由邮箱管理系统自动发送，请勿回复。"
+
+# 通知内容模板，模块加载时确定，生成通知时只需一次format_map替换
+# 简化邮件内容，减少被识别为垃圾邮件的可能性
+_SINGLE_TEMPLATE = (
+    "您有一封重要邮件需要关注。\n"
+    "\n"
+    "邮件主题: {subject}\n"
+    "发件人: {sender}\n"
+    "时间: {date}\n"
+    "重要性: {importance}\n"
+    "\n"
+    "{summary_section}"
+    "{preview_section}"
+    + NOTIFICATION_FOOTER
+)
+
+_BATCH_TEMPLATE = (
+    "您有 {count} 封重要邮件需要关注。\n"
+    "\n"
+    "{items}"
+    + NOTIFICATION_FOOTER
+)
+
+_BATCH_ITEM_TEMPLATE = (
+    "{index}. {subject}\n"
+    "   发件人: {sender}\n"
+    "   时间: {date}\n"
+    "   重要性: {importance}\n"
+    "{summary_line}"
+    "\n"
+)
+
+_SYSTEM_TEMPLATE = (
+    "系统通知: {subject}\n"
+    "\n"
+    "{message}\n"
+    "\n"
+    "时间: {time}\n"
+    "\n"
+    + NOTIFICATION_FOOTER
+)
+
+_ERROR_TEMPLATE = (
+    "系统错误通知\n"
+    "\n"
+    "错误信息: {error_message}\n"
+    "时间: {time}\n"
+    "\n"
+    "{context_section}"
+    "\n"
+    + NOTIFICATION_FOOTER
+)
+
+_TEST_TEMPLATE = (
+    "邮箱管理系统通知功能测试\n"
+    "\n"
+    "这是一封测试邮件，用于验证通知功能是否正常工作。\n"
+    "如果您收到此邮件，说明通知功能配置正确。\n"
+    "\n"
+    "测试时间: {time}\n"
+    "\n"
+    + NOTIFICATION_FOOTER
+)
+
+
+def _preview(text: Optional[str], limit: int) -> str:
+    """截取文本前limit个字符用于通知，空白文本返回空字符串"""
+    if not text or not text.strip():
+        return ''
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def _format_batch_item(index: int, email: Email) -> str:
+    """生成批量通知中一封邮件的条目（纯函数，只依赖传入的邮件）"""
+    summary = _preview(email.summary, 100)
+    return _BATCH_ITEM_TEMPLATE.format_map({
+        'index': index,
+        'subject': email.subject,
+        'sender': email.sender,
+        'date': email.short_date_str,
+        'importance': email.importance,
+        'summary_line': f"   摘要: {summary}\n" if summary else "",
+    })
+
+
+def _email_key(email: Email) -> tuple:
+    """
+    通知内容缓存键：由通知中用到的邮件字段决定，摘要和正文只取通知中显示的预览部分（无需处理整个正文），
+    邮件分析结果改变后自然生成新的键
+    """
+    return (email.subject, email.sender, email.short_date_str, email.importance,
+            _preview(email.summary, 200), _preview(email.body, 300))
+
+
 class NotificationService:
     """通知服务类，用于发送重要邮件提醒"""
     
@@ -27,11 +148,26 @@ class NotificationService:
             password=self.smtp_password
         )
         
-        # 验证通知配置
-        self._validate_notification_config()
+        # SMTP断路器：邮件服务器持续故障时快速失败
+        self._smtp_breaker = CircuitBreaker(
+            'SMTP',
+            fail_max=Config.CIRCUIT_BREAKER_FAIL_MAX,
+            reset_timeout=Config.CIRCUIT_BREAKER_RESET_TIMEOUT
+        )
+        
+        # 已生成的通知内容（LRU），重试、测试等重复通知同一封邮件时直接复用
+        self._body_cache = OrderedDict()
+        
+        # 验证通知配置，结果在初始化时确定，之后的发送直接使用
+        missing_fields = self._validate_notification_config()
+        self._enabled = not missing_fields
     
-    def _validate_notification_config(self):
-        """验证通知配置"""
+    def close(self):
+        """关闭发送通知使用的SMTP连接"""
+        self.school_email_client.close()
+    
+    def _validate_notification_config(self) -> List[str]:
+        """验证通知配置，返回缺少的配置项"""
         required_fields = [
             'NOTIFICATION_EMAIL',
             'NOTIFICATION_SMTP_SERVER',
@@ -47,19 +183,16 @@ class NotificationService:
         if missing_fields:
             logger.warning(f"缺少通知配置项: {', '.join(missing_fields)}")
             logger.warning("通知功能将不可用")
+        
+        return missing_fields
     
     def is_notification_enabled(self) -> bool:
         """检查通知功能是否启用"""
-        return all([
-            self.notification_email,
-            self.smtp_server,
-            self.smtp_username,
-            self.smtp_password
-        ])
+        return self._enabled
     
     def send_important_email_notification(self, email: Email) -> bool:
         """发送重要邮件通知"""
-        if not self.is_notification_enabled():
+        if not self._enabled:
             logger.warning("通知功能未启用，无法发送通知")
             return False
         
@@ -88,38 +221,49 @@ class NotificationService:
             logger.error(f"发送重要邮件通知时出错: {str(e)}")
             return False
     
-    def send_batch_important_email_notification(self, emails: List[Email]) -> int:
-        """批量发送重要邮件通知"""
-        if not self.is_notification_enabled():
+    def send_batch_important_email_notification(self, emails: Iterable[Email]) -> int:
+        """批量发送重要邮件通知，按NOTIFICATION_BATCH_SIZE分批流式处理，不要求传入列表"""
+        emails = iter(emails)
+        batch = list(islice(emails, NOTIFICATION_BATCH_SIZE))
+        if not batch:
+            return 0
+        
+        if not self._enabled:
             logger.warning("通知功能未启用，无法发送通知")
             return 0
         
         try:
-            logger.info(f"批量发送 {len(emails)} 封重要邮件通知")
-            
-            success_count = 0
-            
-            # 如果有多封重要邮件，合并为一封通知邮件
-            if len(emails) > 1:
-                subject = f"重要邮件提醒: 共 {len(emails)} 封重要邮件"
-                body = self._create_batch_notification_body(emails)
-                
-                success = self._send_email(
-                    to_email=self.notification_email,
-                    subject=subject,
-                    body=body
-                )
-                
+            # 先生成所有通知邮件，再通过SMTP连接池并发发送
+            batch_sizes = []
+            messages = []
+            
+            while batch:
+                subject, body = self._build_batch_notification(batch)
+                messages.append({
+                    'to_emails': self.notification_email,
+                    'subject': subject,
+                    'content': body
+                })
+                batch_sizes.append(len(batch))
+                batch = list(islice(emails, NOTIFICATION_BATCH_SIZE))
+            
+            if not self._smtp_breaker.allow_request():
+                logger.warning("SMTP服务暂不可用（断路器已打开），跳过发送重要邮件通知")
+                return 0
+            
+            logger.info(f"批量发送 {sum(batch_sizes)} 封重要邮件通知，共 {len(messages)} 封通知邮件")
+            results = self.school_email_client.send_emails(messages)
+            for success in results:
                 if success:
-                    success_count = len(emails)
-                    logger.info(f"批量重要邮件通知发送成功，共 {success_count} 封")
+                    self._smtp_breaker.record_success()
                 else:
-                    logger.error("批量重要邮件通知发送失败")
+                    self._smtp_breaker.record_failure()
+            
+            success_count = sum(size for size, success in zip(batch_sizes, results) if success)
+            if success_count < sum(batch_sizes):
+                logger.error(f"部分重要邮件通知发送失败，成功 {success_count}/{sum(batch_sizes)} 封")
             else:
-                # 只有一封邮件，单独发送
-                for email in emails:
-                    if self.send_important_email_notification(email):
-                        success_count += 1
+                logger.info(f"批量重要邮件通知发送成功，共 {success_count} 封")
             
             return success_count
             
@@ -127,66 +271,65 @@ class NotificationService:
             logger.error(f"批量发送重要邮件通知时出错: {str(e)}")
             return 0
     
-    def _create_notification_body(self, email: Email) -> str:
-        """创建单封邮件的通知内容"""
-        # 简化邮件内容，减少被识别为垃圾邮件的可能性
-        body_parts = [
-            f"您有一封重要邮件需要关注。",
-            f"",
-            f"邮件主题: {email.subject}",
-            f"发件人: {email.sender}",
-            f"时间: {email.date.strftime('%Y-%m-%d %H:%M')}",
-            f"重要性: {email.importance}",
-            f""
-        ]
+    def _build_batch_notification(self, emails: List[Email]) -> Tuple[str, str]:
+        """生成一批重要邮件的通知主题和内容，多封邮件合并为一封通知"""
+        if len(emails) > 1:
+            subject = f"重要邮件提醒: 共 {len(emails)} 封重要邮件"
+            return subject, self._create_batch_notification_body(emails)
         
-        # 添加邮件总结（如果有）
-        if email.summary and len(email.summary.strip()) > 0:
-            # 限制总结长度
-            summary = email.summary[:200] + "..." if len(email.summary) > 200 else email.summary
-            body_parts.append(f"内容摘要: {summary}")
-            body_parts.append("")
-        
-        # 添加邮件正文预览（限制长度）
-        if email.body and len(email.body.strip()) > 0:
-            preview = email.body[:300] + "..." if len(email.body) > 300 else email.body
-            body_parts.append(f"内容预览: {preview}")
-            body_parts.append("")
-        
-        body_parts.append("此邮件由邮箱管理系统自动发送，请勿回复。")
+        # 只有一封邮件，单独通知
+        email = emails[0]
+        return f"重要邮件提醒: {email.subject}", self._create_notification_body(email)
+    
+    def _render_cached(self, key: tuple, render: Callable[[], str]) -> str:
+        """按key缓存render生成的通知内容"""
+        body = self._body_cache.get(key)
+        if body is not None:
+            self._body_cache.move_to_end(key)
+            return body
         
-        return "\n".join(body_parts)
+        body = render()
+        self._body_cache[key] = body
+        if len(self._body_cache) > NOTIFICATION_BODY_CACHE_SIZE:
+            self._body_cache.popitem(last=False)
+        return body
+    
+    def _create_notification_body(self, email: Email) -> str:
+        """创建单封邮件的通知内容（按邮件内容缓存）"""
+        return self._render_cached(('single', _email_key(email)), lambda: self._render_notification_body(email))
     
     def _create_batch_notification_body(self, emails: List[Email]) -> str:
-        """创建批量邮件的通知内容"""
-        body_parts = [
-            f"您有 {len(emails)} 封重要邮件需要关注。",
-            f""
-        ]
-        
-        # 添加每封邮件的摘要信息
-        for i, email in enumerate(emails, 1):
-            body_parts.append(f"{i}. {email.subject}")
-            body_parts.append(f"   发件人: {email.sender}")
-            body_parts.append(f"   时间: {email.date.strftime('%Y-%m-%d %H:%M')}")
-            body_parts.append(f"   重要性: {email.importance}")
-            
-            # 添加简短总结（如果有）
-            if email.summary and len(email.summary.strip()) > 0:
-                summary = email.summary[:100] + "..." if len(email.summary) > 100 else email.summary
-                body_parts.append(f"   摘要: {summary}")
-            
-            body_parts.append("")
-        
-        body_parts.append("此邮件由邮箱管理系统自动发送，请勿回复。")
-        
-        return "\n".join(body_parts)
+        """创建批量邮件的通知内容（按各邮件内容缓存）"""
+        key = ('batch',) + tuple(_email_key(email) for email in emails)
+        return self._render_cached(key, lambda: self._render_batch_notification_body(emails))
+    
+    def _render_notification_body(self, email: Email) -> str:
+        """生成单封邮件的通知内容"""
+        summary = _preview(email.summary, 200)
+        preview = _preview(email.body, 300)
+        return _SINGLE_TEMPLATE.format_map({
+            'subject': email.subject,
+            'sender': email.sender,
+            'date': email.short_date_str,
+            'importance': email.importance,
+            'summary_section': f"内容摘要: {summary}\n\n" if summary else "",
+            'preview_section': f"内容预览: {preview}\n\n" if preview else "",
+        })
+    
+    def _render_batch_notification_body(self, emails: List[Email]) -> str:
+        """生成批量邮件的通知内容"""
+        items = ''.join(_format_batch_item(i, email) for i, email in enumerate(emails, 1))
+        return _BATCH_TEMPLATE.format_map({'count': len(emails), 'items': items})
     
     def _send_email(self, to_email: str, subject: str, body: str, is_html: bool = False) -> bool:
         """发送邮件"""
+        if not self._smtp_breaker.allow_request():
+            logger.warning("SMTP服务暂不可用（断路器已打开），跳过发送")
+            return False
+        
         try:
             content_type = "html" if is_html else "plain"
-            return self.school_email_client.send_email(
+            success = self.school_email_client.send_email(
                 to_emails=to_email,
                 subject=subject,
                 content=body,
@@ -195,11 +338,17 @@ class NotificationService:
             
         except Exception as e:
             logger.error(f"发送邮件时出错: {str(e)}")
-            return False
+            success = False
+        
+        if success:
+            self._smtp_breaker.record_success()
+        else:
+            self._smtp_breaker.record_failure()
+        return success
     
     def send_system_notification(self, subject: str, message: str) -> bool:
         """发送系统通知"""
-        if not self.is_notification_enabled():
+        if not self._enabled:
             logger.warning("通知功能未启用，无法发送系统通知")
             return False
         
@@ -207,17 +356,11 @@ class NotificationService:
             logger.info(f"发送系统通知: {subject}")
             
             # 创建简化的邮件内容
-            body_parts = [
-                f"系统通知: {subject}",
-                f"",
-                f"{message}",
-                f"",
-                f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                f"",
-                f"此邮件由邮箱管理系统自动发送，请勿回复。"
-            ]
-            
-            body = "\n".join(body_parts)
+            body = _SYSTEM_TEMPLATE.format_map({
+                'subject': subject,
+                'message': message,
+                'time': _current_minute_str()
+            })
             
             # 发送邮件
             success = self._send_email(
@@ -239,7 +382,7 @@ class NotificationService:
     
     def send_error_notification(self, error_message: str, context: Optional[Dict[str, Any]] = None) -> bool:
         """发送错误通知"""
-        if not self.is_notification_enabled():
+        if not self._enabled:
             logger.warning("通知功能未启用，无法发送错误通知")
             return False
         
@@ -247,31 +390,11 @@ class NotificationService:
             logger.info("发送错误通知")
             
             # 创建简化的邮件内容
-            body_parts = [
-                f"系统错误通知",
-                f"",
-                f"错误信息: {error_message}",
-                f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                f""
-            ]
-            
-            # 添加简化的上下文信息（如果有）
-            if context:
-                body_parts.append("相关信息:")
-                try:
-                    # 只显示关键信息，避免复杂的JSON格式
-                    if isinstance(context, dict):
-                        for key, value in list(context.items())[:5]:  # 限制显示前5个键值对
-                            body_parts.append(f"- {key}: {value}")
-                    else:
-                        body_parts.append(f"- {str(context)[:200]}...")  # 限制长度
-                except:
-                    body_parts.append(f"- {str(context)[:200]}...")  # 限制长度
-            
-            body_parts.append("")
-            body_parts.append("此邮件由邮箱管理系统自动发送，请勿回复。")
-            
-            body = "\n".join(body_parts)
+            body = _ERROR_TEMPLATE.format_map({
+                'error_message': error_message,
+                'time': _current_minute_str(),
+                'context_section': self._format_error_context(context) if context else ""
+            })
             
             # 发送邮件
             success = self._send_email(
@@ -291,9 +414,22 @@ class NotificationService:
             logger.error(f"发送错误通知时出错: {str(e)}")
             return False
     
+    @staticmethod
+    def _format_error_context(context: Any) -> str:
+        """生成错误通知中的简化上下文信息，每行以换行结尾"""
+        try:
+            # 只显示关键信息，避免复杂的JSON格式
+            if isinstance(context, dict):
+                lines = ''.join(f"- {key}: {value}\n" for key, value in islice(context.items(), 5))  # 限制显示前5个键值对
+            else:
+                lines = f"- {str(context)[:200]}...\n"  # 限制长度
+        except:
+            lines = f"- {str(context)[:200]}...\n"  # 限制长度
+        return "相关信息:\n" + lines
+    
     def test_notification(self) -> bool:
         """测试通知功能"""
-        if not self.is_notification_enabled():
+        if not self._enabled:
             logger.warning("通知功能未启用，无法测试")
             return False
         
@@ -301,18 +437,7 @@ class NotificationService:
             logger.info("测试通知功能")
             
             # 创建简化的测试邮件内容
-            body_parts = [
-                f"邮箱管理系统通知功能测试",
-                f"",
-                f"这是一封测试邮件，用于验证通知功能是否正常工作。",
-                f"如果您收到此邮件，说明通知功能配置正确。",
-                f"",
-                f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                f"",
-                f"此邮件由邮箱管理系统自动发送，请勿回复。"
-            ]
-            
-            body = "\n".join(body_parts)
+            body = _TEST_TEMPLATE.format_map({'time': _current_minute_str()})
             
             # 发送测试邮件
             success = self._send_email(
@@ -1,25 +1,100 @@
 import os
+import hashlib
 import logging
-import json
-import pickle
-from typing import List, Dict, Any, Optional, Tuple
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime
-from pathlib import Path
 
+import faiss
+import numpy as np
 from langchain_openai import OpenAIEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 
 from config import Config
 from src.models.email_model import Email
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.http_clients import get_async_http_client, get_http_client
+from src.utils.process_pool import create_process_pool
+from src.utils.rate_limiter import get_llm_rate_limiter
+from src.utils.retry import retry_call
+from src.utils.vector_store import (
+    SQLiteDocstore, close_vector_store, create_vector_store, load_vector_store, move_index_to_gpu, save_vector_store
+)
+
+try:
+    import diskcache
+except ImportError:  # 未安装diskcache时不缓存文本分割结果
+    diskcache = None
 
 logger = logging.getLogger(__name__)
 
+# 统计信息缓存有效期（秒）
+STATS_CACHE_TTL = 30
+
+# 问答提示模板，模块加载时解析一次，重建向量数据库后重新创建QA链时直接复用
+QA_PROMPT = PromptTemplate(
+    template="""使用以下上下文来回答问题。如果你不知道答案，就说你不知道，不要试图编造答案。
+上下文信息：
+{context}
+
+问题：{question}
+
+请基于提供的邮件上下文信息回答问题。如果上下文中没有相关信息，请明确说明。答案应该简洁明了，直接针对问题。
+回答：""",
+    input_variables=["context", "question"]
+)
+
+# 写入向量数据库的关键信息字段及其标签（按顺序）
+KEY_INFO_FIELDS = (
+    ('key_points', '关键要点'),
+    ('action_items', '行动项'),
+    ('important_dates', '重要日期'),
+    ('contacts', '联系人'),
+)
+
+# 增量添加邮件后不立即保存向量数据库：未保存的邮件达到该数量，或距上次保存超过该时间（秒）时才写入磁盘
+VECTOR_STORE_SAVE_EVERY = 50
+VECTOR_STORE_SAVE_INTERVAL = 300
+
+# 文本分块大小和重叠字符数
+TEXT_CHUNK_SIZE = 1000
+TEXT_CHUNK_OVERLAP = 200
+
+# 进程池工作进程中使用的文本分割器，首次分割时创建
+_worker_text_splitter = None
+
+
+def _new_text_splitter() -> RecursiveCharacterTextSplitter:
+    """创建文本分割器"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=TEXT_CHUNK_SIZE,
+        chunk_overlap=TEXT_CHUNK_OVERLAP,
+        length_function=len
+    )
+
+
+def _split_text(text: str) -> List[str]:
+    """在进程池中分割单个文档的文本（模块级函数，可被子进程调用）"""
+    global _worker_text_splitter
+    if _worker_text_splitter is None:
+        _worker_text_splitter = _new_text_splitter()
+    return _worker_text_splitter.split_text(text)
+
+
+def _split_cache_key(text: str) -> str:
+    """文本分割结果的缓存键：分块参数和文本内容的SHA-256"""
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f"{TEXT_CHUNK_SIZE}:{TEXT_CHUNK_OVERLAP}:{digest}"
+
+
 class RAGService:
     """RAG检索服务类，用于从历史邮件中检索和提取信息"""
     
@@ -33,16 +108,24 @@ class RAGService:
         # 根据配置选择LLM提供商
         self.llm = self._init_llm()
         
-        # 文本分割器
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
+        # 文本分割器，以及按文档内容缓存的分割结果（重建时内容未变的邮件无需重新分割）
+        self.text_splitter = _new_text_splitter()
+        self._split_cache = self._open_split_cache()
+        
+        # 分割大量邮件使用的进程池，首次需要时创建，之后的写入和重建复用，close时关闭
+        self._split_pool = None
         
         # 向量数据库
         self.vector_store = None
         self.qa_chain = None
+        self._retriever = None
+        
+        # 统计信息缓存：(计算时间, 统计结果)
+        self._stats_cache = None
+        
+        # 尚未保存到磁盘的新增邮件数和上次保存时间
+        self._unsaved_count = 0
+        self._last_saved_at = time.monotonic()
         
         # 确保向量数据库目录存在
         os.makedirs(self.vector_db_path, exist_ok=True)
@@ -62,11 +145,15 @@ class RAGService:
                 raise ValueError("使用Qwen embedding时必须设置QWEN_API_KEY")
             
             logger.info(f"使用Qwen embedding模型: {Config.EMBEDDING_MODEL}")
-            return OpenAIEmbeddings(
+            embeddings = OpenAIEmbeddings(
                 openai_api_key=Config.QWEN_API_KEY,
                 openai_api_base=Config.QWEN_API_BASE,
-                model=Config.EMBEDDING_MODEL
+                model=Config.EMBEDDING_MODEL,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client()
             )
+            # 缓存embedding结果，重复的问题和内容未变的文档不再请求embedding服务
+            return CachedEmbeddings(embeddings, Config.EMBEDDING_MODEL, Config.EMBEDDING_CACHE_PATH)
         else:
             raise ValueError(f"不支持的embedding提供商: {provider}，请使用 'qwen'")
     
@@ -83,7 +170,9 @@ class RAGService:
                 openai_api_key=Config.GEMINI_API_KEY,
                 openai_api_base=Config.GEMINI_API_BASE,
                 temperature=0.1,
-                model_name=Config.LLM_MODEL
+                model_name=Config.LLM_MODEL,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client()
             )
         elif provider == 'qwen':
             if not Config.QWEN_API_KEY:
@@ -94,7 +183,9 @@ class RAGService:
                 openai_api_key=Config.QWEN_API_KEY,
                 openai_api_base=Config.QWEN_API_BASE,
                 temperature=0.1,
-                model_name=Config.LLM_MODEL
+                model_name=Config.LLM_MODEL,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client()
             )
         else:
             raise ValueError(f"不支持的LLM提供商: {provider}，请使用 'gemini' 或 'qwen'")
@@ -102,67 +193,117 @@ class RAGService:
     def _load_or_init_vector_store(self):
         """加载或初始化向量数据库"""
         try:
-            index_path = Path(self.vector_db_path) / "index.faiss"
-            
-            if index_path.exists():
-                # 加载现有的向量数据库
-                logger.info("加载现有向量数据库")
-                self.vector_store = FAISS.load_local(
-                    self.vector_db_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
+            # 加载现有的向量数据库（索引文件和SQLite文档库）
+            self.vector_store = load_vector_store(self.vector_db_path, self.embeddings)
+            
+            if self.vector_store is not None:
+                logger.info("已加载现有向量数据库")
+                self._configure_index(self.vector_store)
             else:
                 # 初始化新的向量数据库
                 logger.info("初始化新的向量数据库")
-                self.vector_store = FAISS.from_texts(
-                    ["初始化文档"],
-                    self.embeddings
-                )
+                self.vector_store = self._build_vector_store([])
                 # 保存初始向量数据库
-                self.vector_store.save_local(self.vector_db_path)
+                save_vector_store(self.vector_store, self.vector_db_path)
         except Exception as e:
             logger.error(f"加载或初始化向量数据库时出错: {str(e)}")
-            # 创建一个新的向量数据库
-            self.vector_store = FAISS.from_texts(
-                ["初始化文档"],
-                self.embeddings
-            )
+            # 创建一个新的向量数据库（与正常初始化的索引类型、度量一致）
+            self.vector_store = self._build_vector_store([])
+    
+    @staticmethod
+    def _configure_index(vector_store: FAISS):
+        """设置查询参数：IVF索引按配置的nprobe搜索聚类，精确索引无需设置；有可用GPU时将索引迁移到GPU"""
+        ivf_index = faiss.try_extract_index_ivf(vector_store.index)
+        if ivf_index is not None:
+            ivf_index.nprobe = Config.VECTOR_INDEX_NPROBE
+        
+        # nprobe在迁移前设置，复制到GPU的索引沿用该参数
+        if Config.VECTOR_INDEX_USE_GPU:
+            move_index_to_gpu(vector_store)
+    
+    def _build_vector_store(self, docs: List[Document]) -> FAISS:
+        """
+        批量embedding文档并创建新的向量数据库
+        
+        向量数量达到VECTOR_INDEX_IVF_THRESHOLD时使用IVF+PQ索引（用全部向量训练），查询只扫描nprobe个聚类，
+        且向量经过乘积量化压缩；数量较少时使用暴力检索索引（默认以fp16保存向量）。
+        向量在写入和查询时归一化，使用内积度量计算余弦相似度，检索时每一维只需一次乘加
+        """
+        if not docs:
+            docs = [Document(page_content="初始化文档")]
+        
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        vectors = self.embed_batch(texts)
+        
+        index = self._create_ivfpq_index(vectors)
+        if index is None:
+            index = self._create_flat_index(len(vectors[0]))
+        
+        vector_store = create_vector_store(self.embeddings, index, InMemoryDocstore(), {})
+        vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+        self._configure_index(vector_store)
+        return vector_store
+    
+    @staticmethod
+    def _create_flat_index(dimension: int) -> faiss.Index:
+        """
+        创建暴力检索索引：暴力检索受内存带宽限制，以fp16保存向量可使扫描的数据量减半，
+        对相似度排序几乎没有影响；fp16标量量化无需训练，可以直接增量添加
+        """
+        if Config.VECTOR_INDEX_FP16:
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexFlatIP(dimension)
+    
+    @staticmethod
+    def _create_ivfpq_index(vectors: List[List[float]]) -> Optional[faiss.Index]:
+        """向量足够多时创建并训练IVF+PQ索引，否则返回None（使用精确索引）"""
+        threshold = Config.VECTOR_INDEX_IVF_THRESHOLD
+        if not threshold or len(vectors) < threshold:
+            return None
+        
+        dimension = len(vectors[0])
+        nlist, pq_m = Config.VECTOR_INDEX_NLIST, Config.VECTOR_INDEX_PQ_M
+        if dimension % pq_m:
+            logger.warning(f"embedding维度 {dimension} 不能被PQ子向量数量 {pq_m} 整除，使用精确索引")
+            return None
+        
+        logger.info(f"使用IVF{nlist},PQ{pq_m}索引，训练向量数: {len(vectors)}")
+        index = faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}", faiss.METRIC_INNER_PRODUCT)
+        # 与写入的向量一样先归一化再训练
+        training_vectors = np.asarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(training_vectors)
+        index.train(training_vectors)
+        index.nprobe = Config.VECTOR_INDEX_NPROBE
+        return index
     
     def _init_qa_chain(self):
         """初始化QA链"""
         try:
-            # 自定义提示模板
-            template = """使用以下上下文来回答问题。如果你不知道答案，就说你不知道，不要试图编造答案。
-上下文信息：
-{context}
-
-问题：{question}
-
-请基于提供的邮件上下文信息回答问题。如果上下文中没有相关信息，请明确说明。答案应该简洁明了，直接针对问题。
-回答："""
-            
-            prompt = PromptTemplate(
-                template=template,
-                input_variables=["context", "question"]
-            )
-            
-            # 使用新的LCEL语法创建检索QA链
-            retriever = self.vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 5}
-            )
+            # 检索器绑定当前向量数据库，增量添加邮件后仍然有效，重建时重新创建
+            self._retriever = self._create_retriever()
             
-            # 创建QA链
-            self.qa_chain = {
-                "context": retriever | self._format_docs,
-                "question": RunnablePassthrough()
-            } | prompt | self.llm | StrOutputParser()
+            # 创建QA链：输入为 {"context": 已检索文档的文本, "question": 问题}，
+            # 检索在调用方完成，检索结果同时作为来源文档返回，每个问题只检索一次
+            self.qa_chain = QA_PROMPT | self.llm | StrOutputParser()
             
             logger.info("QA链初始化完成")
         except Exception as e:
             logger.error(f"初始化QA链时出错: {str(e)}")
     
+    def _create_retriever(self):
+        """创建当前向量数据库的检索器"""
+        return self.vector_store.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": 5}
+        )
+    
+    def _get_retriever(self):
+        """获取检索器，QA链初始化失败时在此创建"""
+        if self._retriever is None:
+            self._retriever = self._create_retriever()
+        return self._retriever
+    
     def _format_docs(self, docs):
         """格式化文档用于提示"""
         return "\n\n".join(doc.page_content for doc in docs)
@@ -184,11 +325,11 @@ class RAGService:
             # 分割文档
             docs = self.text_splitter.split_documents([doc])
             
-            # 添加到向量数据库
-            self.vector_store.add_documents(docs)
+            # 批量计算embedding并添加到向量数据库
+            self._add_documents(self.vector_store, docs)
             
-            # 保存向量数据库
-            self.vector_store.save_local(self.vector_db_path)
+            self._stats_cache = None
+            self._mark_unsaved(1)
             
             logger.info(f"邮件已成功添加到向量数据库: {email.subject}")
             return True
@@ -202,34 +343,14 @@ class RAGService:
         try:
             logger.info(f"批量添加 {len(emails)} 封邮件到向量数据库")
             
-            success_count = 0
-            all_docs = []
-            
-            for email in emails:
-                try:
-                    # 准备文档内容
-                    doc_content = self._prepare_email_document(email)
-                    
-                    # 创建文档
-                    doc = Document(
-                        page_content=doc_content['content'],
-                        metadata=doc_content['metadata']
-                    )
-                    
-                    # 分割文档
-                    docs = self.text_splitter.split_documents([doc])
-                    all_docs.extend(docs)
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"处理邮件时出错: {email.subject}, 错误: {str(e)}")
-                    continue
-            
-            # 批量添加到向量数据库
+            # 准备并分割所有邮件文档
+            all_docs, success_count = self._split_emails(emails)
+            
+            # 批量计算embedding并添加到向量数据库
             if all_docs:
-                self.vector_store.add_documents(all_docs)
-                # 保存向量数据库
-                self.vector_store.save_local(self.vector_db_path)
+                self._add_documents(self.vector_store, all_docs)
+                self._stats_cache = None
+                self._mark_unsaved(success_count)
             
             logger.info(f"成功添加 {success_count} 封邮件到向量数据库")
             return success_count
@@ -238,34 +359,186 @@ class RAGService:
             logger.error(f"批量添加邮件到向量数据库时出错: {str(e)}")
             return 0
     
+    def _mark_unsaved(self, count: int):
+        """记录新增的邮件数，累计足够多或距上次保存足够久时保存向量数据库"""
+        self._unsaved_count += count
+        if (self._unsaved_count >= VECTOR_STORE_SAVE_EVERY
+                or time.monotonic() - self._last_saved_at >= VECTOR_STORE_SAVE_INTERVAL):
+            self._save()
+    
+    def _save(self):
+        """将向量数据库保存到磁盘"""
+        save_vector_store(self.vector_store, self.vector_db_path)
+        self._unsaved_count = 0
+        self._last_saved_at = time.monotonic()
+    
+    def flush(self):
+        """保存尚未写入磁盘的新增邮件"""
+        if self._unsaved_count:
+            try:
+                self._save()
+                logger.info("向量数据库已保存")
+            except Exception as e:
+                logger.error(f"保存向量数据库时出错: {str(e)}")
+    
+    def close(self):
+        """保存尚未写入磁盘的新增邮件并关闭分割文本的进程池，系统停止时调用"""
+        self.flush()
+        if self._split_pool is not None:
+            self._split_pool.shutdown(wait=True)
+            self._split_pool = None
+    
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量计算文本的embedding，每个批次只发送一次请求，多个批次并发提交
+        
+        文本先按长度排序再分批，使同一批次中的文本长度相近，减少服务端按最长文本补齐的计算量；
+        返回的向量按原始顺序排列
+        """
+        batch_size = Config.EMBEDDING_BATCH_SIZE
+        if len(texts) <= batch_size:
+            return self._embed_one_batch(texts) if texts else []
+        
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        sorted_texts = [texts[index] for index in order]
+        batches = [sorted_texts[start:start + batch_size] for start in range(0, len(sorted_texts), batch_size)]
+        
+        # 预分配结果位置，按批次顺序保存各批次的向量
+        results = [None] * len(batches)
+        max_workers = min(Config.EMBEDDING_CONCURRENCY, len(batches))
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._embed_one_batch, batch, jitter=True): index
+                for index, batch in enumerate(batches)
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        
+        # 恢复为输入文本的顺序
+        vectors = [None] * len(texts)
+        sorted_vectors = (vector for batch_vectors in results for vector in batch_vectors)
+        for index, vector in zip(order, sorted_vectors):
+            vectors[index] = vector
+        return vectors
+    
+    def _embed_one_batch(self, batch: List[str], jitter: bool = False) -> List[List[float]]:
+        """计算单个批次的embedding，失败时按退避策略单独重试"""
+        if jitter:
+            # 错开并发请求的发出时间，避免瞬时触发限流
+            time.sleep(random.uniform(0, 0.2))
+        return retry_call(self.embeddings.embed_documents, batch)
+    
+    def _add_documents(self, vector_store: FAISS, docs: List[Document]):
+        """批量embedding文档后一次性写入向量数据库"""
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        
+        vectors = self.embed_batch(texts)
+        vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    
+    def _split_emails(self, emails: List[Email]) -> Tuple[List[Document], int]:
+        """
+        准备邮件文档并分割为文本块，返回 (文本块列表, 成功处理的邮件数)
+        
+        分割结果按文档内容缓存，只分割缓存中没有的文档；需要分割的邮件数达到RAG_SPLIT_PROCESS_MIN_EMAILS时
+        在进程池中分割（分割是纯Python的CPU密集操作），只把文档文本传给子进程，邮件对象可能带有不可序列化的正文加载函数
+        """
+        docs = []
+        for email in emails:
+            try:
+                doc_content = self._prepare_email_document(email)
+                docs.append(Document(
+                    page_content=doc_content['content'],
+                    metadata=doc_content['metadata']
+                ))
+            except Exception as e:
+                logger.error(f"处理邮件时出错: {email.subject}, 错误: {str(e)}")
+        
+        keys = [_split_cache_key(doc.page_content) for doc in docs]
+        chunk_texts = [self._split_cache_get(key) for key in keys]
+        missing = [index for index, texts in enumerate(chunk_texts) if texts is None]
+        
+        min_emails = Config.RAG_SPLIT_PROCESS_MIN_EMAILS
+        if min_emails > 0 and len(missing) >= min_emails:
+            logger.info(f"在进程池中分割 {len(missing)} 封邮件")
+            if self._split_pool is None:
+                self._split_pool = create_process_pool(Config.RAG_SPLIT_PROCESS_WORKERS)
+            split_texts = list(self._split_pool.map(
+                _split_text, [docs[index].page_content for index in missing], chunksize=32
+            ))
+        else:
+            split_texts = [self.text_splitter.split_text(docs[index].page_content) for index in missing]
+        
+        for index, texts in zip(missing, split_texts):
+            chunk_texts[index] = texts
+            self._split_cache_set(keys[index], texts)
+        
+        chunks = [
+            Document(page_content=text, metadata=dict(doc.metadata))
+            for doc, texts in zip(docs, chunk_texts)
+            for text in texts
+        ]
+        return chunks, len(docs)
+    
+    @staticmethod
+    def _open_split_cache():
+        """打开磁盘上的文本分割结果缓存，不可用时返回None"""
+        if diskcache is None or not Config.RAG_SPLIT_CACHE_PATH:
+            return None
+        
+        try:
+            return diskcache.Cache(Config.RAG_SPLIT_CACHE_PATH)
+        except Exception as e:
+            logger.error(f"打开文本分割缓存失败: {str(e)}")
+            return None
+    
+    def _split_cache_get(self, key: str) -> Optional[List[str]]:
+        if self._split_cache is None:
+            return None
+        
+        try:
+            return self._split_cache.get(key)
+        except Exception as e:
+            logger.warning(f"读取文本分割缓存失败: {str(e)}")
+            return None
+    
+    def _split_cache_set(self, key: str, texts: List[str]):
+        if self._split_cache is None:
+            return
+        
+        try:
+            self._split_cache.set(key, texts)
+        except Exception as e:
+            logger.warning(f"写入文本分割缓存失败: {str(e)}")
+    
     def _prepare_email_document(self, email: Email) -> Dict[str, Any]:
         """准备邮件文档内容"""
-        # 构建文档内容
-        content = f"主题: {email.subject}\n"
-        content += f"发件人: {email.sender}\n"
-        content += f"日期: {email.date.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        content += f"重要性: {email.importance or '未知'}\n"
-        content += f"类别: {email.category or '未知'}\n\n"
+        # 各段落收集到列表中最后一次拼接，避免长正文被反复复制
+        parts = [
+            f"主题: {email.subject}\n"
+            f"发件人: {email.sender}\n"
+            f"日期: {email.date_str}\n"
+            f"重要性: {email.importance or '未知'}\n"
+            f"类别: {email.category or '未知'}\n\n"
+        ]
         
         # 添加邮件总结（如果有）
         if email.summary:
-            content += f"总结: {email.summary}\n\n"
+            parts.append(f"总结: {email.summary}\n\n")
         
         # 添加关键信息（如果有）
         if email.key_info:
-            content += "关键信息:\n"
-            if email.key_info.get('key_points'):
-                content += f"关键要点: {'; '.join(email.key_info['key_points'])}\n"
-            if email.key_info.get('action_items'):
-                content += f"行动项: {'; '.join(email.key_info['action_items'])}\n"
-            if email.key_info.get('important_dates'):
-                content += f"重要日期: {'; '.join(email.key_info['important_dates'])}\n"
-            if email.key_info.get('contacts'):
-                content += f"联系人: {'; '.join(email.key_info['contacts'])}\n"
-            content += "\n"
+            parts.append("关键信息:\n")
+            parts.extend(
+                f"{label}: {'; '.join(email.key_info[field])}\n"
+                for field, label in KEY_INFO_FIELDS if email.key_info.get(field)
+            )
+            parts.append("\n")
         
         # 添加邮件正文
-        content += f"正文: {email.body}"
+        parts.append(f"正文: {email.body}")
+        content = ''.join(parts)
         
         # 构建元数据
         metadata = {
@@ -289,7 +562,7 @@ class RAGService:
             logger.info(f"搜索邮件，查询: {query}")
             
             # 使用相似性搜索
-            docs = self.vector_store.similarity_search_with_score(query, k=k)
+            docs = retry_call(self.vector_store.similarity_search_with_score, query, k=k)
             
             # 格式化结果
             results = []
@@ -308,21 +581,34 @@ class RAGService:
             logger.error(f"搜索邮件时出错: {str(e)}")
             return []
     
+    def _retrieve_context(self, question: str) -> Tuple[List[Document], str]:
+        """检索问题的相关文档，返回 (来源文档, 上下文文本)，并按将要发送的内容为LLM请求限速"""
+        # 复用已创建的检索器
+        source_docs = retry_call(self._get_retriever().invoke, question)
+        context = self._format_docs(source_docs)
+        
+        # 按问题和上下文长度估算token数参与限速（中文约每字符1个token）
+        get_llm_rate_limiter().acquire(len(question) + len(context))
+        return source_docs, context
+    
+    def ask_question_stream(self, question: str) -> Iterator[str]:
+        """
+        流式回答问题：检索一次后逐段产出模型生成的文本，调用方在第一段文本到达时即可开始显示
+        
+        与ask_question不同，出错时异常直接抛给调用方
+        """
+        logger.info(f"流式回答问题: {question}")
+        _, context = self._retrieve_context(question)
+        yield from self.qa_chain.stream({"context": context, "question": question})
+    
     def ask_question(self, question: str) -> Dict[str, Any]:
         """基于邮件内容回答问题"""
         try:
             logger.info(f"回答问题: {question}")
             
-            # 首先获取相关文档
-            retriever = self.vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 5}
-            )
-            # 使用invoke方法获取相关文档
-            source_docs = retriever.invoke(question)
-            
-            # 使用QA链回答问题
-            answer = self.qa_chain.invoke(question)
+            # 获取相关文档，并使用QA链基于检索到的文档回答问题
+            source_docs, context = self._retrieve_context(question)
+            answer = self.qa_chain.invoke({"context": context, "question": question})
             
             # 格式化源文档信息
             formatted_source_docs = []
@@ -349,21 +635,32 @@ class RAGService:
             }
     
     def get_email_statistics(self) -> Dict[str, Any]:
-        """获取邮件统计信息"""
+        """获取邮件统计信息，结果在STATS_CACHE_TTL秒内复用"""
+        if self._stats_cache is not None:
+            cached_at, cached_stats = self._stats_cache
+            if time.monotonic() - cached_at < STATS_CACHE_TTL:
+                return cached_stats
+        
         try:
-            # 这里可以实现更复杂的统计逻辑
-            # 目前返回基本统计信息
-            
             # 获取向量数据库中的文档数量
-            doc_count = len(self.vector_store.docstore._dict)
+            doc_count = len(self.vector_store.index_to_docstore_id)
             
             # 返回基本统计信息
             stats = {
                 'total_emails': doc_count,
+                'total_chunks': doc_count,
                 'vector_db_path': self.vector_db_path,
                 'last_updated': datetime.now().isoformat()
             }
             
+            # SQLite文档库中直接按邮件聚合统计（内存中的文档库只在新建或重建后保存前短暂存在）
+            docstore = self.vector_store.docstore
+            if isinstance(docstore, SQLiteDocstore):
+                stats['total_emails'] = docstore.email_count()
+                stats['by_category'] = docstore.email_counts_by('category')
+                stats['by_importance'] = docstore.email_counts_by('importance')
+            
+            self._stats_cache = (time.monotonic(), stats)
             return stats
             
         except Exception as e:
@@ -378,49 +675,22 @@ class RAGService:
         try:
             logger.info("开始重建向量数据库")
             
-            # 创建新的向量数据库
-            new_vector_store = FAISS.from_texts(
-                ["初始化文档"],
-                self.embeddings
-            )
-            
-            # 添加所有邮件
-            success_count = 0
-            all_docs = []
-            
-            for email in emails:
-                try:
-                    # 准备文档内容
-                    doc_content = self._prepare_email_document(email)
-                    
-                    # 创建文档
-                    doc = Document(
-                        page_content=doc_content['content'],
-                        metadata=doc_content['metadata']
-                    )
-                    
-                    # 分割文档
-                    docs = self.text_splitter.split_documents([doc])
-                    all_docs.extend(docs)
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"处理邮件时出错: {email.subject}, 错误: {str(e)}")
-                    continue
-            
-            # 批量添加到新向量数据库
-            if all_docs:
-                new_vector_store.add_documents(all_docs)
-            
-            # 替换现有向量数据库
-            self.vector_store = new_vector_store
+            # 准备并分割所有邮件文档
+            all_docs, success_count = self._split_emails(emails)
             
-            # 保存向量数据库
-            self.vector_store.save_local(self.vector_db_path)
+            # 批量计算embedding并创建新向量数据库，向量较多时使用IVF+PQ索引
+            new_vector_store = self._build_vector_store(all_docs)
             
-            # 重新初始化QA链
+            # 替换现有向量数据库并重新初始化QA链
+            old_vector_store, self.vector_store = self.vector_store, new_vector_store
+            self._stats_cache = None
+            self._retriever = None
             self._init_qa_chain()
             
+            # 关闭旧文档库的连接（丢弃其未保存的修改）后，将新数据库写入同一个SQLite文件
+            close_vector_store(old_vector_store)
+            self._save()
+            
             logger.info(f"向量数据库重建完成，成功添加 {success_count} 封邮件")
             return True
             
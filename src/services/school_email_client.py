@@ -11,20 +11,139 @@ import imaplib
 import email
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+from email.mime.base import MIMEBase
 from email.header import decode_header
+from email import policy
+import base64
+import binascii
+import quopri
 import os
+import json
 import logging
+import re
+import select
+import ssl
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
-from typing import List, Optional, Dict, Any, Union
+from functools import partial
+from typing import List, Optional, Dict, Any, Tuple, Union
 
 from config import Config
 from src.models.email_model import Email, EmailAttachment
+from src.utils.retry import compute_backoff
+from src.utils.smtp_pool import get_smtp_pool
 
 # 设置日志
 logger = logging.getLogger(__name__)
 
+# 单条FETCH命令中包含的最大邮件数量，避免命令行过长
+FETCH_BATCH_SIZE = 100
+
+# 附件按块读取并编码，块大小为57的倍数，每57字节正好编码为一行76个字符的base64
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
+
+# DATA内容中需要转义的行首句点（RFC 5321 4.5.2）
+_LEADING_DOT_RE = re.compile(rb'(?m)^\.')
+
+# 序列化后的邮件缓存条目数（只缓存不带附件的邮件，如通知）
+MIME_CACHE_SIZE = 64
+
+# 发送时序列化邮件使用的策略：与MIMEMultipart默认的compat32一致，换行符使用SMTP要求的CRLF
+_SMTP_POLICY = policy.compat32.clone(linesep='\r\n')
+
+# FETCH被服务器拒绝（如限流）时的最大重试次数，重试间隔指数退避
+FETCH_MAX_RETRIES = 3
+
+# 获取新邮件时未能获取或解析的邮件，在之后的检查中最多再尝试的次数，仍失败则放弃
+FAILED_UID_MAX_ATTEMPTS = 3
+
+# 从FETCH响应中提取UID，如 b'12 (UID 345 BODY[] {3456}'
+_UID_RE = re.compile(rb'UID (\d+)')
+
+# BODYSTRUCTURE响应的词法单元：括号、带引号的字符串、其他原子（含NIL）
+_BODYSTRUCTURE_TOKEN_RE = re.compile(rb'\(|\)|"((?:[^"\\]|\\.)*)"|[^\s()]+')
+
+# FETCH响应中的字面量长度标记，如 {123}
+_LITERAL_RE = re.compile(rb'\{\d+\}$')
+
+# 一封邮件FETCH响应的开头，如 b'12 ('
+_FETCH_START_RE = re.compile(rb'\d+ \(')
+
+# 文件夹列表缓存有效期（秒），文件夹很少变化，轮询期间无需每次发送LIST
+FOLDER_CACHE_TTL = 60
+
+# RFC 2177建议客户端至少每29分钟重新发起一次IDLE
+IDLE_MAX_SECONDS = 29 * 60
+
+# IDLE期间检查停止信号的间隔（秒），停止时最多等待这么久即可结束IDLE并释放连接
+IDLE_POLL_SECONDS = 1.0
+
+
+def _parse_bodystructure(data: bytes) -> Optional[list]:
+    """将BODYSTRUCTURE括号表达式（从开头的括号到与之匹配的括号）解析为嵌套列表，字符串为str，NIL为None"""
+    stack = []
+    for match in _BODYSTRUCTURE_TOKEN_RE.finditer(data):
+        token = match.group(0)
+        if token == b'(':
+            stack.append([])
+        elif not stack:
+            return None
+        elif token == b')':
+            node = stack.pop()
+            if not stack:
+                return node
+            stack[-1].append(node)
+        elif match.group(1) is not None:
+            stack[-1].append(match.group(1).decode('utf-8', errors='ignore'))
+        else:
+            stack[-1].append(None if token.upper() == b'NIL' else token.decode('utf-8', errors='ignore'))
+    return None
+
+
+def _find_text_part(structure: list, path: Tuple[int, ...] = ()) -> Optional[Tuple[str, str, str]]:
+    """在BODYSTRUCTURE中查找第一个text/plain部分，返回 (段号, 传输编码, 字符集)"""
+    if structure and isinstance(structure[0], list):
+        # 多部分：开头的若干个列表是各子部分
+        for index, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            found = _find_text_part(child, path + (index,))
+            if found:
+                return found
+        return None
+    
+    if len(structure) < 6 or not isinstance(structure[0], str) or not isinstance(structure[1], str):
+        return None
+    if (structure[0].lower(), structure[1].lower()) != ('text', 'plain'):
+        return None
+    
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = next((str(params[i + 1]) for i in range(0, len(params) - 1, 2)
+                    if str(params[i]).lower() == 'charset'), 'utf-8')
+    encoding = (structure[5] or '7bit').lower()
+    section = '.'.join(str(i) for i in path) or '1'
+    return section, encoding, charset
+
+
+def _decode_preview(data: bytes, encoding: str, charset: str) -> str:
+    """解码部分获取（可能在任意位置截断）的正文片段"""
+    try:
+        if encoding == 'base64':
+            data = b''.join(data.split())
+            data = binascii.a2b_base64(data[:len(data) - len(data) % 4])
+        elif encoding == 'quoted-printable':
+            # 丢弃被截断的转义序列
+            cut = data.rfind(b'=', max(0, len(data) - 2))
+            if cut != -1:
+                data = data[:cut]
+            data = quopri.decodestring(data)
+        return data.decode(charset, errors='ignore')
+    except (binascii.Error, LookupError, ValueError):
+        return data.decode('utf-8', errors='ignore')
+
 
 class SchoolEmailClient:
     """学校邮箱客户端类，整合发送和接收功能"""
@@ -44,11 +163,31 @@ class SchoolEmailClient:
         # 学校邮箱服务器配置
         self.smtp_server = getattr(Config, 'SMTP_SERVER', 'mail.sjtu.edu.cn')
         self.smtp_port = getattr(Config, 'SMTP_PORT', 465)
+        self._make_smtp_server, self._smtp_connect_message = self._bind_smtp_factory()
         self.imap_server = getattr(Config, 'IMAP_SERVER', 'mail.sjtu.edu.cn')
         self.imap_port = getattr(Config, 'IMAP_PORT', 993)
         
         # 连接对象
         self.imap_connection = None
+        self._idle_supported = None
+        
+        # 文件夹列表缓存：(获取时间, 文件夹列表)
+        self._folders_cache: Optional[Tuple[float, List[str]]] = None
+        
+        # SMTP连接池（同一账号的客户端共用），多次发送之间复用已登录的连接，避免每封邮件都重新建立TLS连接和登录
+        self._smtp_pool = get_smtp_pool(
+            self.smtp_server, self.smtp_port, self.school_email, self._connect_smtp,
+            max_size=getattr(Config, 'SMTP_POOL_SIZE', 5),
+            max_messages_per_connection=getattr(Config, 'SMTP_MAX_MESSAGES_PER_CONNECTION', 100)
+        )
+        
+        # 序列化后的邮件（LRU），相同内容的邮件重复发送时跳过MIME构建和编码
+        self._mime_cache = OrderedDict()
+        self._mime_cache_lock = threading.Lock()
+        
+        # 每个文件夹已获取的最大UID（及对应的UIDVALIDITY），用于增量获取新邮件
+        self.state_path = getattr(Config, 'IMAP_STATE_PATH', './data/imap_state.json')
+        self._uid_state = self._load_uid_state()
         
         logger.info(f"初始化学校邮箱客户端: {self.school_email}")
     
@@ -67,69 +206,20 @@ class SchoolEmailClient:
         Returns:
             bool: 发送是否成功
         """
-        # 创建邮件对象
-        msg = MIMEMultipart()
-        msg['From'] = self.school_email
-        msg['To'] = ', '.join(to_emails) if isinstance(to_emails, list) else to_emails
-        msg['Subject'] = subject
+        # 创建邮件对象并序列化
+        raw_message, recipients = self._serialize_message(to_emails, subject, content, content_type, attachments)
         
-        # 添加邮件正文
-        if content_type == "html":
-            msg.attach(MIMEText(content, 'html', 'utf-8'))
-        else:
-            msg.attach(MIMEText(content, 'plain', 'utf-8'))
-        
-        # 添加附件
-        if attachments:
-            for file_path in attachments:
-                if os.path.exists(file_path):
-                    with open(file_path, 'rb') as f:
-                        part = MIMEApplication(f.read())
-                        part.add_header(
-                            'Content-Disposition',
-                            'attachment',
-                            filename=os.path.basename(file_path)
-                        )
-                        msg.attach(part)
-                    logger.info(f"已添加附件: {file_path}")
-                else:
-                    logger.warning(f"附件文件不存在: {file_path}")
-        
-        # 连接SMTP服务器并发送邮件
-        logger.info("正在连接SMTP服务器...")
-        server = None
+        conn = None
+        reuse = False
         try:
-            # 根据端口选择正确的连接方式
-            if self.smtp_port == 465:
-                # 465端口使用SSL直接连接
-                logger.info(f"使用SSL连接到 {self.smtp_server}:{self.smtp_port}")
-                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
-            elif self.smtp_port == 587:
-                # 587端口使用STARTTLS
-                logger.info(f"使用STARTTLS连接到 {self.smtp_server}:{self.smtp_port}")
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-                server.starttls()
-            else:
-                # 其他端口默认使用SSL
-                logger.info(f"使用SSL连接到 {self.smtp_server}:{self.smtp_port}")
-                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
-            
-            # 登录邮箱
-            try:
-                server.login(self.school_email, self.password)
-                logger.info("邮箱登录成功")
-            except Exception as login_error:
-                logger.error(f"邮箱登录失败: {str(login_error)}")
-                raise Exception(f"邮箱登录失败: {str(login_error)}")
+            conn = self._smtp_pool.acquire()
             
             # 发送邮件
             try:
                 # 使用sendmail方法，更可靠
-                text = msg.as_string()
-                if isinstance(to_emails, list):
-                    result = server.sendmail(self.school_email, to_emails, text)
-                else:
-                    result = server.sendmail(self.school_email, [to_emails], text)
+                result = self._sendmail(conn.server, recipients, raw_message)
+                conn.messages_sent += 1
+                reuse = True
                 
                 # 检查sendmail的返回结果
                 if result:  # 如果有返回值，表示有失败的收件人
@@ -146,41 +236,262 @@ class SchoolEmailClient:
                 logger.error(f"发件人被拒绝: {str(e)}")
                 raise Exception(f"发件人被拒绝: {str(e)}")
             except smtplib.SMTPDataError as e:
+                # 学校邮箱发送后异常关闭连接，交给外层按发送成功处理
+                if self._is_school_close_quirk(e):
+                    raise
                 logger.error(f"邮件数据错误: {str(e)}")
                 raise Exception(f"邮件数据错误: {str(e)}")
             except smtplib.SMTPException as e:
+                if isinstance(e, smtplib.SMTPResponseException) and self._is_school_close_quirk(e):
+                    raise
                 logger.error(f"SMTP错误: {str(e)}")
                 raise Exception(f"SMTP错误: {str(e)}")
             
         except smtplib.SMTPResponseException as e:
             # 特殊处理学校邮箱的连接关闭异常
-            if e.smtp_code == -1 and e.smtp_error == b'\x00\x00\x00':
+            if self._is_school_close_quirk(e):
                 logger.info("邮件发送成功! (学校邮箱连接关闭异常，但邮件已成功发送)")
                 logger.info(f"收件人: {to_emails}")
                 return True
             else:
                 logger.error(f"SMTP响应异常: {e.smtp_code}, {e.smtp_error}")
-                logger.error(f"发送邮件失败: {str(e)}")
-                import traceback
-                logger.error(f"详细错误信息: {traceback.format_exc()}")
+                # 异常堆栈由logging在实际输出时格式化
+                logger.error("发送邮件失败: %s", e, exc_info=True)
                 return False
                 
         except Exception as e:
-            logger.error(f"发送邮件失败: {str(e)}")
-            import traceback
-            logger.error(f"详细错误信息: {traceback.format_exc()}")
+            logger.error("发送邮件失败: %s", e, exc_info=True)
             return False
-            
+        
         finally:
-            # 确保连接被关闭
-            if server:
+            # 发送成功的连接归还连接池复用，出错的连接状态未知，直接关闭
+            if conn is not None:
+                self._smtp_pool.release(conn, reuse=reuse)
+    
+    def send_emails(self, messages: List[Dict[str, Any]]) -> List[bool]:
+        """
+        通过SMTP连接池并发发送多封邮件，复用已登录的连接
+        
+        Args:
+            messages (list): 每项为send_email的参数字典（to_emails、subject、content，可选content_type、attachments）
+            
+        Returns:
+            list: 每封邮件是否发送成功，与messages一一对应
+        """
+        if len(messages) <= 1:
+            return [self._send_email_safe(params) for params in messages]
+        
+        max_workers = min(self._smtp_pool.max_size, len(messages))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='smtp-send') as executor:
+            return list(executor.map(self._send_email_safe, messages))
+    
+    def _sendmail(self, server: smtplib.SMTP, recipients: List[str], raw_message: bytes) -> Dict[str, Tuple[int, bytes]]:
+        """
+        在已登录的连接上发送一封邮件，返回被拒绝的收件人（与smtplib.sendmail相同）
+        
+        服务器支持PIPELINING（RFC 2920）时，MAIL FROM、全部RCPT TO和DATA命令一次发出后再依次读取应答，
+        每封邮件只需两次往返；不支持时使用smtplib.sendmail逐条命令等待应答。
+        服务器同时支持CHUNKING（RFC 3030）时用BDAT代替DATA，邮件字节串原样发送，无需复制一份做句点转义
+        """
+        server.ehlo_or_helo_if_needed()
+        if not server.has_extn('pipelining'):
+            return server.sendmail(self.school_email, recipients, raw_message)
+        
+        mail_options = f" SIZE={len(raw_message)}" if server.has_extn('size') else ""
+        commands = [f"MAIL FROM:{smtplib.quoteaddr(self.school_email)}{mail_options}\r\n"]
+        commands.extend(f"RCPT TO:{smtplib.quoteaddr(recipient)}\r\n" for recipient in recipients)
+        use_bdat = server.has_extn('chunking')
+        if not use_bdat:
+            commands.append("DATA\r\n")
+        server.send(''.join(commands))
+        
+        mail_code, mail_resp = server.getreply()
+        senderrs = {}
+        for recipient in recipients:
+            code, resp = server.getreply()
+            if code not in (250, 251):
+                senderrs[recipient] = (code, resp)
+        data_code, data_resp = (None, None) if use_bdat else server.getreply()
+        
+        if mail_code != 250 or len(senderrs) == len(recipients):
+            # 服务器仍然接受了DATA时发送空内容结束本次事务
+            if data_code == 354:
+                server.send(b'.\r\n')
+                server.getreply()
+            server.rset()
+            if mail_code != 250:
+                raise smtplib.SMTPSenderRefused(mail_code, mail_resp, self.school_email)
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+        
+        if use_bdat:
+            server.send(f"BDAT {len(raw_message)} LAST\r\n")
+            server.send(raw_message)
+            code, resp = server.getreply()
+            if code != 250:
+                raise smtplib.SMTPDataError(code, resp)
+            return senderrs
+        
+        if data_code != 354:
+            server.rset()
+            raise smtplib.SMTPDataError(data_code, data_resp)
+        
+        data = _LEADING_DOT_RE.sub(b'..', raw_message)
+        if not data.endswith(b'\r\n'):
+            data += b'\r\n'
+        server.send(data + b'.\r\n')
+        
+        code, resp = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return senderrs
+    
+    def _send_email_safe(self, params: Dict[str, Any]) -> bool:
+        """发送一封邮件，参数错误等异常视为发送失败"""
+        try:
+            return self.send_email(**params)
+        except Exception as e:
+            logger.error(f"发送邮件失败: {str(e)}")
+            return False
+    
+    def close(self):
+        """关闭连接池中的空闲SMTP连接和IMAP连接"""
+        self._smtp_pool.close()
+        self.disconnect_imap()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+    
+    def _serialize_message(self, to_emails: Union[str, List[str]], subject: str, content: str,
+                           content_type: str = "plain", attachments: Optional[List[str]] = None) -> Tuple[bytes, List[str]]:
+        """
+        创建邮件并序列化为发送用的字节串，返回 (邮件字节串, 收件人列表)
+        
+        不带附件的邮件按 (收件人, 主题, 内容, 内容类型) 缓存序列化结果；带附件的邮件每次重新构建，避免缓存占用大量内存
+        """
+        if attachments:
+            msg, recipients = self._build_message(to_emails, subject, content, content_type, attachments)
+            return msg.as_bytes(policy=_SMTP_POLICY), recipients
+        
+        key = (tuple(to_emails) if isinstance(to_emails, list) else to_emails, subject, content, content_type)
+        with self._mime_cache_lock:
+            cached = self._mime_cache.get(key)
+            if cached is not None:
+                self._mime_cache.move_to_end(key)
+                return cached
+        
+        msg, recipients = self._build_message(to_emails, subject, content, content_type)
+        cached = (msg.as_bytes(policy=_SMTP_POLICY), recipients)
+        with self._mime_cache_lock:
+            self._mime_cache[key] = cached
+            if len(self._mime_cache) > MIME_CACHE_SIZE:
+                self._mime_cache.popitem(last=False)
+        return cached
+    
+    def _build_message(self, to_emails: Union[str, List[str]], subject: str, content: str,
+                       content_type: str = "plain", attachments: Optional[List[str]] = None):
+        """创建邮件对象，返回 (邮件对象, 收件人列表)"""
+        msg = MIMEMultipart()
+        msg['From'] = self.school_email
+        msg['To'] = ', '.join(to_emails) if isinstance(to_emails, list) else to_emails
+        msg['Subject'] = subject
+        
+        # 添加邮件正文
+        if content_type == "html":
+            msg.attach(MIMEText(content, 'html', 'utf-8'))
+        else:
+            msg.attach(MIMEText(content, 'plain', 'utf-8'))
+        
+        # 添加附件
+        if attachments:
+            for file_path in attachments:
+                if os.path.exists(file_path):
+                    part = self._build_attachment(file_path)
+                    part.add_header(
+                        'Content-Disposition',
+                        'attachment',
+                        filename=os.path.basename(file_path)
+                    )
+                    msg.attach(part)
+                    logger.info(f"已添加附件: {file_path}")
+                else:
+                    logger.warning(f"附件文件不存在: {file_path}")
+        
+        recipients = to_emails if isinstance(to_emails, list) else [to_emails]
+        return msg, recipients
+    
+    @staticmethod
+    def _build_attachment(file_path: str) -> MIMEBase:
+        """
+        创建附件部分：按块读取文件并逐块base64编码，内存中只保留编码结果，不再同时持有整个原始文件
+        """
+        chunks = []
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(ATTACHMENT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(base64.encodebytes(chunk).decode('ascii'))
+        
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(''.join(chunks))
+        part['Content-Transfer-Encoding'] = 'base64'
+        return part
+    
+    def _bind_smtp_factory(self):
+        """根据端口确定SMTP连接方式（初始化时确定一次），返回 (创建连接的函数, 连接日志)"""
+        if self.smtp_port == 587:
+            # 587端口使用STARTTLS
+            return self._connect_starttls, f"使用STARTTLS连接到 {self.smtp_server}:{self.smtp_port}"
+        
+        # 465端口使用SSL直接连接，其他端口默认也使用SSL
+        return partial(smtplib.SMTP_SSL, self.smtp_server, self.smtp_port), \
+            f"使用SSL连接到 {self.smtp_server}:{self.smtp_port}"
+    
+    def _connect_starttls(self) -> smtplib.SMTP:
+        """建立STARTTLS连接"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        server.starttls()
+        return server
+    
+    def _connect_smtp(self):
+        """连接SMTP服务器并登录"""
+        logger.info("正在连接SMTP服务器...")
+        
+        logger.info(self._smtp_connect_message)
+        server = self._make_smtp_server()
+        
+        # 登录邮箱
+        try:
+            server.login(self.school_email, self.password)
+            logger.info("邮箱登录成功")
+        except Exception as login_error:
+            logger.error(f"邮箱登录失败: {str(login_error)}")
+            self._close_smtp(server)
+            raise Exception(f"邮箱登录失败: {str(login_error)}")
+        
+        return server
+    
+    @staticmethod
+    def _close_smtp(server):
+        """关闭SMTP连接，返回None便于调用方重置连接变量"""
+        if server:
+            try:
+                server.quit()
+            except:
                 try:
-                    server.quit()
+                    server.close()
                 except:
-                    try:
-                        server.close()
-                    except:
-                        pass
+                    pass
+        return None
+    
+    @staticmethod
+    def _is_school_close_quirk(error: smtplib.SMTPResponseException) -> bool:
+        """学校邮箱发送后会异常关闭连接（返回码-1），此时邮件实际已发送成功"""
+        return error.smtp_code == -1 and error.smtp_error == b'\x00\x00\x00'
     
     def connect_imap(self) -> bool:
         """连接到IMAP服务器"""
@@ -190,6 +501,7 @@ class SchoolEmailClient:
             
             # 登录邮箱
             self.imap_connection.login(self.school_email, self.password)
+            self._idle_supported = None
             
             logger.info(f"成功连接到IMAP服务器: {self.imap_server}")
             return True
@@ -209,6 +521,17 @@ class SchoolEmailClient:
             finally:
                 self.imap_connection = None
     
+    def is_imap_connected(self) -> bool:
+        """检查IMAP连接是否仍然有效（不会发起新连接）"""
+        if not self.imap_connection:
+            return False
+        
+        try:
+            status, _ = self.imap_connection.noop()
+            return status == 'OK'
+        except Exception:
+            return False
+    
     def _ensure_imap_connection(self) -> bool:
         """确保IMAP连接有效"""
         if not self.imap_connection:
@@ -222,6 +545,165 @@ class SchoolEmailClient:
             # 连接已断开，尝试重新连接
             return self.connect_imap()
     
+    def supports_idle(self) -> bool:
+        """检查服务器是否支持IMAP IDLE（RFC 2177），结果在每次登录后缓存"""
+        if self._idle_supported is None:
+            try:
+                # 部分服务器只在登录后才通告IDLE能力，因此重新查询CAPABILITY
+                status, data = self.imap_connection.capability()
+                capabilities = data[0].upper().split() if status == 'OK' and data else []
+                self._idle_supported = b'IDLE' in capabilities
+            except Exception as e:
+                logger.error(f"查询IMAP服务器能力时出错: {str(e)}")
+                self._idle_supported = False
+            
+            logger.info(f"IMAP服务器{'支持' if self._idle_supported else '不支持'}IDLE")
+        
+        return self._idle_supported
+    
+    def idle_wait(self, folder: str = 'INBOX', timeout: float = IDLE_MAX_SECONDS,
+                  stop_event: Optional[threading.Event] = None) -> Optional[bool]:
+        """
+        使用IMAP IDLE等待服务器推送新邮件通知
+        
+        Args:
+            folder (str): 要监听的邮箱文件夹
+            timeout (float): 最长等待时间（秒），不超过29分钟以避免服务器IDLE超时
+            stop_event (threading.Event): 设置后在IDLE_POLL_SECONDS内结束IDLE并返回False
+            
+        Returns:
+            Optional[bool]: 收到新邮件通知返回True，超时或被停止返回False，
+                            服务器不支持IDLE或IDLE失败时返回None（调用方应回退到轮询）
+        """
+        if stop_event is not None and stop_event.is_set():
+            return False
+        
+        if not self._ensure_imap_connection() or not self.supports_idle():
+            return None
+        
+        timeout = min(timeout, IDLE_MAX_SECONDS)
+        conn = self.imap_connection
+        tag = None
+        
+        try:
+            status, _ = conn.select(f'"{folder}"')
+            if status != 'OK':
+                logger.error(f"选择文件夹失败: {folder}")
+                return None
+            
+            tag = conn._new_tag()
+            conn.send(tag + b' IDLE\r\n')
+            response = conn.readline()
+            if not response.startswith(b'+'):
+                logger.error(f"服务器拒绝IDLE命令: {response!r}")
+                return None
+            
+            has_new_email = False
+            sock = conn.socket()
+            deadline = time.monotonic() + timeout
+            
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    
+                    # 缓冲区中已有数据时无需等待socket可读；按短间隔等待，以便及时响应停止信号
+                    if not self._idle_data_buffered(conn, sock):
+                        readable, _, _ = select.select([sock], [], [], min(remaining, IDLE_POLL_SECONDS))
+                        if not readable:
+                            if stop_event is not None and stop_event.is_set():
+                                break
+                            continue
+                    
+                    line = conn.readline()
+                    if not line:
+                        raise imaplib.IMAP4.abort("IDLE期间连接被服务器关闭")
+                    
+                    if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+                        has_new_email = True
+                        break
+            finally:
+                # 结束IDLE并读取到对应的标签响应
+                conn.send(b'DONE\r\n')
+                while True:
+                    line = conn.readline()
+                    if not line or line.startswith(tag):
+                        break
+            
+            return has_new_email
+            
+        except Exception as e:
+            logger.error(f"IMAP IDLE出错: {str(e)}")
+            # 连接状态未知，丢弃连接，下次使用时重新建立
+            try:
+                conn.shutdown()
+            except Exception:
+                pass
+            self.imap_connection = None
+            return None
+        finally:
+            if tag is not None:
+                conn.tagged_commands.pop(tag, None)
+    
+    @staticmethod
+    def _idle_data_buffered(conn: imaplib.IMAP4, sock) -> bool:
+        """
+        检查IDLE期间是否已有未读取的服务器响应
+        
+        imaplib通过带缓冲的文件对象读取响应，与 "+ idling" 同一个TLS记录到达的推送已被读入缓冲区，
+        此时socket不再可读（SSL层也没有待读数据）；以非阻塞方式peek，可同时取得缓冲区、SSL层和socket中的数据
+        """
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(conn.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def idle_loop(self, callback, folder: str = 'INBOX', stop_event: Optional[threading.Event] = None,
+                  poll_interval: Optional[float] = None):
+        """
+        通过IMAP IDLE持续监听新邮件，收到服务器推送后只获取新增UID的邮件并调用callback(emails)
+
+        每次IDLE最长29分钟，超时后重新发起；服务器不支持IDLE或IDLE失败时按poll_interval轮询，
+        下一轮会重新建立连接并再次尝试IDLE
+
+        Args:
+            callback: 接收新邮件列表的回调函数
+            folder (str): 要监听的邮箱文件夹
+            stop_event (threading.Event): 设置后结束正在进行的IDLE并退出循环
+            poll_interval (float): 回退轮询的间隔（秒），默认使用EMAIL_CHECK_INTERVAL
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        if poll_interval is None:
+            poll_interval = Config.EMAIL_CHECK_INTERVAL
+
+        logger.info(f"开始监听新邮件: {folder}")
+
+        # 先获取一次，建立UID记录，之后只获取推送通知后新增的邮件
+        has_new_email = True
+        while not stop_event.is_set():
+            if has_new_email:
+                emails = self.get_new_emails(folder)
+                if emails:
+                    try:
+                        callback(emails)
+                    except Exception as e:
+                        logger.error(f"处理新邮件回调时出错: {str(e)}")
+
+            has_new_email = self.idle_wait(folder, IDLE_MAX_SECONDS, stop_event)
+            if has_new_email is None:
+                # 不支持IDLE或连接异常，等待后重新检查
+                has_new_email = True
+                if stop_event.wait(poll_interval):
+                    break
+
+        logger.info(f"停止监听新邮件: {folder}")
+
     def receive_emails(self, folder: str = 'INBOX', limit: int = 10, unread_only: bool = False) -> List[Email]:
         """
         接收邮件
@@ -236,62 +718,349 @@ class SchoolEmailClient:
         """
         emails = []
         try:
-            if not self._ensure_imap_connection():
+            email_id_list = self._search_uids(folder, limit, unread_only)
+            if not email_id_list:
                 return emails
             
-            # 选择文件夹
-            status, _ = self.imap_connection.select(f'"{folder}"')
-            if status != 'OK':
-                logger.error(f"选择文件夹失败: {folder}")
-                return emails
+            # 批量获取邮件内容（从最新邮件开始），未读邮件获取后标记为已读
+            emails = self._fetch_emails(email_id_list, mark_seen=unread_only)
             
-            # 搜索邮件
-            search_criteria = "UNSEEN" if unread_only else "ALL"
-            status, message_ids = self.imap_connection.search(None, search_criteria)
+            logger.info(f"成功获取 {len(emails)} 封邮件")
+            return emails
             
-            if status != 'OK':
-                logger.error("搜索邮件失败")
+        except Exception as e:
+            logger.error(f"接收邮件失败: {str(e)}")
+            return emails
+    
+    def receive_emails_parallel(self, folder: str = 'INBOX', limit: int = 0, unread_only: bool = False,
+                                workers: Optional[int] = None) -> List[Email]:
+        """
+        使用多条IMAP连接并行接收邮件，适合首次同步等一次获取大量邮件的场景
+        
+        邮件UID列表按顺序分成workers段，每段在独立的IMAP连接中批量获取，结果按原顺序合并
+        
+        Args:
+            folder (str): 邮箱文件夹
+            limit (int): 获取邮件数量限制，0表示不限制
+            unread_only (bool): 是否只获取未读邮件
+            workers (int): 并行的IMAP连接数，默认使用配置IMAP_FETCH_WORKERS
+            
+        Returns:
+            list: 邮件列表，从最新邮件开始
+        """
+        workers = workers or getattr(Config, 'IMAP_FETCH_WORKERS', 4)
+        emails = []
+        try:
+            email_id_list = self._search_uids(folder, limit, unread_only)
+            if not email_id_list:
                 return emails
             
-            # 获取邮件ID列表
-            email_id_list = message_ids[0].split()
+            # 邮件较少时多建连接得不偿失，直接使用当前连接获取
+            workers = min(workers, -(-len(email_id_list) // FETCH_BATCH_SIZE))
+            if workers <= 1:
+                emails = self._fetch_emails(email_id_list, mark_seen=unread_only)
+            else:
+                slice_size = -(-len(email_id_list) // workers)
+                slices = [email_id_list[i:i + slice_size] for i in range(0, len(email_id_list), slice_size)]
+                
+                with ThreadPoolExecutor(max_workers=len(slices), thread_name_prefix='imap-fetch') as executor:
+                    results = list(executor.map(
+                        lambda ids: self._fetch_in_new_session(folder, ids, unread_only), slices
+                    ))
+                
+                # 每段结果已是从新到旧，按段倒序合并即为整体从新到旧
+                for result in reversed(results):
+                    emails.extend(result)
             
-            # 限制邮件数量
-            if limit > 0:
-                email_id_list = email_id_list[-limit:]
+            logger.info(f"成功获取 {len(emails)} 封邮件（{workers} 条连接）")
+            return emails
             
-            logger.info(f"找到 {len(email_id_list)} 封邮件")
+        except Exception as e:
+            logger.error(f"并行接收邮件失败: {str(e)}")
+            return emails
+    
+    def _search_uids(self, folder: str, limit: int, unread_only: bool) -> List[bytes]:
+        """选择文件夹并搜索邮件UID，返回最近的limit个UID（limit为0时返回全部）"""
+        if not self._ensure_imap_connection():
+            return []
+        
+        # 选择文件夹
+        status, _ = self.imap_connection.select(f'"{folder}"')
+        if status != 'OK':
+            logger.error(f"选择文件夹失败: {folder}")
+            self._folders_cache = None
+            return []
+        
+        # 搜索邮件（使用UID，邮件删除后也保持稳定）
+        search_criteria = "UNSEEN" if unread_only else "ALL"
+        status, message_ids = self.imap_connection.uid('search', None, search_criteria)
+        
+        if status != 'OK':
+            logger.error("搜索邮件失败")
+            return []
+        
+        # 获取邮件ID列表
+        email_id_list = message_ids[0].split()
+        
+        # 限制邮件数量
+        if limit > 0:
+            email_id_list = email_id_list[-limit:]
+        
+        logger.info(f"找到 {len(email_id_list)} 封邮件")
+        return email_id_list
+    
+    def _fetch_in_new_session(self, folder: str, email_id_list: List[bytes], mark_seen: bool) -> List[Email]:
+        """新建一条IMAP连接获取指定UID的邮件，完成后断开"""
+        connection = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+        try:
+            connection.login(self.school_email, self.password)
+            status, _ = connection.select(f'"{folder}"')
+            if status != 'OK':
+                logger.error(f"选择文件夹失败: {folder}")
+                return []
+            return self._fetch_emails(email_id_list, mark_seen=mark_seen, connection=connection)
+        finally:
+            try:
+                connection.logout()
+            except Exception:
+                pass
+    
+    def _fetch_emails(self, email_id_list: List[bytes], mark_seen: bool = False,
+                      connection: Optional[imaplib.IMAP4] = None) -> List[Email]:
+        """
+        按UID批量获取邮件内容，每FETCH_BATCH_SIZE封邮件只发送一次FETCH命令
+        
+        Args:
+            email_id_list (list): UID SEARCH返回的邮件UID列表
+            mark_seen (bool): 获取后是否标记为已读
+            connection: 使用的IMAP连接，默认为当前连接
             
-            # 获取邮件内容
-            for email_id in reversed(email_id_list):  # 从最新邮件开始
-                try:
-                    status, msg_data = self.imap_connection.fetch(email_id, '(RFC822)')
+        Returns:
+            List[Email]: 邮件列表，从最新邮件开始
+        """
+        connection = connection or self.imap_connection
+        emails = []
+        
+        for start in range(0, len(email_id_list), FETCH_BATCH_SIZE):
+            batch_ids = email_id_list[start:start + FETCH_BATCH_SIZE]
+            id_set = b','.join(batch_ids)
+            
+            try:
+                # BODY.PEEK[]不会隐式设置\Seen，是否标记为已读由下面的STORE决定
+                status, msg_data = self._uid_fetch(connection, id_set, '(BODY.PEEK[])')
+                if status != 'OK':
+                    logger.error(f"批量获取邮件失败: {id_set.decode('utf-8')}")
+                    continue
+                
+                raw_emails = self._parse_fetch_response(msg_data)
+                
+                for email_id in batch_ids:
+                    raw_email = raw_emails.get(email_id)
+                    if raw_email is None:
+                        logger.error(f"获取邮件 {email_id} 时出错: 服务器未返回邮件内容")
+                        continue
                     
-                    if status == 'OK':
-                        raw_email = msg_data[0][1]
-                        email_message = email.message_from_bytes(raw_email)
+                    try:
+                        email_message = email.message_from_bytes(raw_email, policy=policy.default)
                         
                         # 解析邮件信息
-                        email_obj = self._parse_email_to_model(email_id.decode('utf-8'), email_message)
-                        emails.append(email_obj)
-                        
-                        # 如果是未读邮件，标记为已读
-                        if unread_only:
-                            self.imap_connection.store(email_id, '+FLAGS', '\\Seen')
-                    
-                    # 添加延迟避免请求过快
-                    time.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"获取邮件 {email_id} 时出错: {str(e)}")
+                        emails.append(self._parse_email_to_model(email_id.decode('utf-8'), email_message))
+                    except Exception as e:
+                        logger.error(f"解析邮件 {email_id} 时出错: {str(e)}")
+                
+                if mark_seen:
+                    connection.uid('store', id_set, '+FLAGS', '\\Seen')
+            except Exception as e:
+                logger.error(f"批量获取邮件时出错: {str(e)}")
+        
+        emails.reverse()
+        return emails
+    
+    def list_email_headers(self, folder: str = 'INBOX', limit: int = 10, unread_only: bool = False,
+                           preview_size: int = 0) -> List[Email]:
+        """
+        只获取邮件头部列出邮件，不下载完整正文和附件（也不标记为已读）
+        
+        返回的Email对象body为空（或为正文预览），访问Email.lazy_body时才通过IMAP获取完整正文和附件
+        
+        Args:
+            folder (str): 邮箱文件夹
+            limit (int): 获取邮件数量限制
+            unread_only (bool): 是否只获取未读邮件
+            preview_size (int): 大于0时先查询BODYSTRUCTURE，再只获取纯文本正文的前preview_size字节作为body
+            
+        Returns:
+            list: 邮件列表，从最新邮件开始
+        """
+        emails = []
+        try:
+            email_id_list = self._search_uids(folder, limit, unread_only)
+            
+            for start in range(0, len(email_id_list), FETCH_BATCH_SIZE):
+                id_set = b','.join(email_id_list[start:start + FETCH_BATCH_SIZE])
+                status, msg_data = self._uid_fetch(self.imap_connection, id_set, '(RFC822.SIZE BODY.PEEK[HEADER])')
+                if status != 'OK':
+                    logger.error(f"批量获取邮件头部失败: {id_set.decode('utf-8')}")
                     continue
+                
+                previews = self._fetch_previews(id_set, preview_size) if preview_size > 0 else {}
+                
+                for email_id, raw_header in self._parse_fetch_response(msg_data).items():
+                    try:
+                        email_obj = Email.from_header_bytes(
+                            email_id.decode('utf-8'), raw_header,
+                            body_loader=partial(self._fetch_body_parts, folder, email_id, raw_header)
+                        )
+                        email_obj.body = previews.get(email_id, "")
+                        emails.append(email_obj)
+                    except Exception as e:
+                        logger.error(f"解析邮件 {email_id} 头部时出错: {str(e)}")
             
-            logger.info(f"成功获取 {len(emails)} 封邮件")
+            emails.sort(key=lambda e: int(e.id), reverse=True)
+            logger.info(f"成功获取 {len(emails)} 封邮件的头部")
             return emails
             
         except Exception as e:
-            logger.error(f"接收邮件失败: {str(e)}")
+            logger.error(f"获取邮件头部失败: {str(e)}")
             return emails
     
+    def _fetch_previews(self, id_set: bytes, preview_size: int) -> Dict[bytes, str]:
+        """
+        获取一批邮件的纯文本正文预览
+        
+        先查询BODYSTRUCTURE找到每封邮件的text/plain部分，再按段号分组部分获取（BODY.PEEK[段号]<0.N>），
+        附件和HTML部分不会被下载
+        """
+        status, msg_data = self._uid_fetch(self.imap_connection, id_set, '(BODYSTRUCTURE)')
+        if status != 'OK':
+            logger.error(f"获取邮件结构失败: {id_set.decode('utf-8')}")
+            return {}
+        
+        # 按段号分组：{段号: {UID: (编码, 字符集)}}
+        sections: Dict[str, Dict[bytes, Tuple[str, str]]] = {}
+        for email_id, line in self._join_fetch_lines(msg_data).items():
+            start = line.find(b'BODYSTRUCTURE ')
+            structure = _parse_bodystructure(line[start + len(b'BODYSTRUCTURE '):]) if start != -1 else None
+            text_part = _find_text_part(structure) if structure else None
+            if text_part:
+                section, encoding, charset = text_part
+                sections.setdefault(section, {})[email_id] = (encoding, charset)
+        
+        previews = {}
+        for section, parts in sections.items():
+            status, msg_data = self._uid_fetch(
+                self.imap_connection, b','.join(parts), f'(BODY.PEEK[{section}]<0.{preview_size}>)'
+            )
+            if status != 'OK':
+                continue
+            for email_id, data in self._parse_fetch_response(msg_data).items():
+                if email_id in parts:
+                    encoding, charset = parts[email_id]
+                    previews[email_id] = _decode_preview(data, encoding, charset)
+        return previews
+    
+    @staticmethod
+    def _join_fetch_lines(msg_data: List[Any]) -> Dict[bytes, bytes]:
+        """
+        将不含大段内容的FETCH响应（如BODYSTRUCTURE）按邮件拼接为单行，返回 {UID: 响应行}
+        
+        响应中的字面量（如非ASCII文件名）会以元组形式拆开，这里将其还原为带引号的字符串
+        """
+        messages = []
+        for item in msg_data:
+            if isinstance(item, tuple):
+                piece = _LITERAL_RE.sub(b'', item[0]) + b'"' + item[1].replace(b'"', b'') + b'"'
+            elif isinstance(item, bytes):
+                piece = item
+            else:
+                continue
+            
+            # 每封邮件的响应以 "序号 (" 开头，其余片段是上一封邮件响应的延续
+            if not messages or _FETCH_START_RE.match(piece):
+                messages.append(piece)
+            else:
+                messages[-1] += piece
+        
+        lines = {}
+        for line in messages:
+            uid_match = _UID_RE.search(line)
+            if uid_match:
+                lines[uid_match.group(1)] = line
+        return lines
+    
+    def _fetch_body_parts(self, folder: str, email_id: bytes,
+                          raw_header: bytes) -> Tuple[str, Optional[str], List[EmailAttachment]]:
+        """按需获取只列出了头部的邮件正文（BODY.PEEK[TEXT]），与头部拼接后解析出正文和附件"""
+        try:
+            if not self._ensure_imap_connection():
+                return "", None, []
+            
+            status, _ = self.imap_connection.select(f'"{folder}"')
+            if status != 'OK':
+                logger.error(f"选择文件夹失败: {folder}")
+                return "", None, []
+            
+            status, msg_data = self._uid_fetch(self.imap_connection, email_id, '(BODY.PEEK[TEXT])')
+            raw_text = self._parse_fetch_response(msg_data).get(email_id) if status == 'OK' else None
+            if raw_text is None:
+                logger.error(f"获取邮件 {email_id} 正文失败")
+                return "", None, []
+            
+            email_message = email.message_from_bytes(raw_header + raw_text, policy=policy.default)
+            return Email._extract_parts(email_message)
+            
+        except Exception as e:
+            logger.error(f"获取邮件 {email_id} 正文时出错: {str(e)}")
+            return "", None, []
+    
+    @staticmethod
+    def _parse_fetch_response(msg_data: List[Any]) -> Dict[bytes, bytes]:
+        """
+        解析UID FETCH响应，返回 {UID: 内容}
+        
+        响应中每封邮件是一个 (b'12 (UID 345 BODY[] {3456}', 内容) 元组，元组之后是该邮件响应的剩余部分（如 b')'）；
+        服务器也可以把UID放在内容之后（RFC 3501允许任意顺序），如 (b'12 (BODY[] {3456}', 内容), b' UID 345)'
+        """
+        contents = {}
+        for index, item in enumerate(msg_data):
+            if not isinstance(item, tuple):
+                continue
+            
+            uid_match = _UID_RE.search(item[0])
+            if uid_match is None and index + 1 < len(msg_data) and isinstance(msg_data[index + 1], bytes):
+                uid_match = _UID_RE.search(msg_data[index + 1])
+            if uid_match:
+                contents[uid_match.group(1)] = item[1]
+        return contents
+    
+    def _uid_fetch(self, connection: imaplib.IMAP4, id_set: bytes, message_parts: str):
+        """
+        执行UID FETCH，不在请求之间主动等待；服务器拒绝命令（返回NO或协议错误，通常是限流）时
+        才按指数退避重试，连接断开（IMAP4.abort）直接抛出
+        """
+        attempt = 0
+        while True:
+            error = None
+            try:
+                status, msg_data = connection.uid('fetch', id_set, message_parts)
+                if status != 'NO':
+                    return status, msg_data
+            except imaplib.IMAP4.abort:
+                raise
+            except imaplib.IMAP4.error as e:
+                error = e
+            
+            if attempt >= FETCH_MAX_RETRIES:
+                if error is not None:
+                    raise error
+                return status, msg_data
+            
+            delay = compute_backoff(attempt, 1.0, 10.0)
+            logger.warning(f"服务器拒绝FETCH命令，{delay:.1f} 秒后重试 ({attempt + 1}/{FETCH_MAX_RETRIES}): "
+                           f"{str(error) if error is not None else msg_data}")
+            time.sleep(delay)
+            attempt += 1
+    
     def _parse_email_to_model(self, email_id: str, email_message) -> Email:
         """
         解析邮件内容为Email模型对象
@@ -313,6 +1082,11 @@ class SchoolEmailClient:
         Returns:
             list: 文件夹列表
         """
+        if self._folders_cache is not None:
+            cached_at, cached_folders = self._folders_cache
+            if time.monotonic() - cached_at < FOLDER_CACHE_TTL:
+                return list(cached_folders)
+        
         folders = []
         try:
             if not self._ensure_imap_connection():
@@ -324,6 +1098,7 @@ class SchoolEmailClient:
                 for folder in folder_list:
                     folder_name = folder.decode('utf-8').split('"/"')[-1].strip(' "')
                     folders.append(folder_name)
+                self._folders_cache = (time.monotonic(), list(folders))
             
             logger.info(f"获取到 {len(folders)} 个文件夹")
             return folders
@@ -336,69 +1111,156 @@ class SchoolEmailClient:
         """
         获取新邮件（兼容现有系统接口）
         
+        已记录该文件夹的最大UID时，由服务器筛选出该UID之后的邮件（UID SEARCH UID N+1:*），
+        否则按since时间获取，未指定时间时获取未读邮件
+        获取或解析失败的邮件会记录下来，在之后的检查中重试（最多FAILED_UID_MAX_ATTEMPTS次）
+        
         Args:
             folder_name (str): 邮箱文件夹
-            since (datetime): 获取此时间之后的邮件
+            since (datetime): 获取此时间之后的邮件（仅在没有UID记录时使用）
             
         Returns:
             List[Email]: 邮件列表
         """
-        if since:
-            # 计算时间差，转换为天数
-            days_diff = (datetime.now() - since).days
-            if days_diff < 1:
-                days_diff = 1
+        try:
+            if not self._ensure_imap_connection():
+                return []
             
-            # 使用搜索条件获取指定时间后的邮件
-            try:
-                if not self._ensure_imap_connection():
-                    return []
-                
-                # 选择文件夹
-                status, _ = self.imap_connection.select(f'"{folder_name}"')
-                if status != 'OK':
-                    logger.error(f"选择文件夹失败: {folder_name}")
-                    return []
-                
+            # 选择文件夹
+            status, _ = self.imap_connection.select(f'"{folder_name}"')
+            if status != 'OK':
+                logger.error(f"选择文件夹失败: {folder_name}")
+                # 文件夹可能已被删除或改名，下次重新获取文件夹列表
+                self._folders_cache = None
+                return []
+            
+            uidvalidity = self._current_uidvalidity()
+            last_uid = self._get_last_uid(folder_name, uidvalidity)
+            failed_uids = self._get_failed_uids(folder_name)
+            if last_uid:
+                search_criteria = f'UID {last_uid + 1}:*'
+            elif since:
                 # 搜索指定时间后的邮件
-                date_str = since.strftime('%d-%b-%Y')
-                status, message_ids = self.imap_connection.search(None, f'(SINCE "{date_str}")')
-                
-                if status != 'OK':
-                    logger.error("搜索邮件失败")
-                    return []
-                
-                # 获取邮件ID列表
-                email_id_list = message_ids[0].split()
-                
-                logger.info(f"找到 {len(email_id_list)} 封新邮件")
-                
-                # 获取邮件内容
-                emails = []
-                for email_id in reversed(email_id_list):  # 从最新邮件开始
-                    try:
-                        status, msg_data = self.imap_connection.fetch(email_id, '(RFC822)')
-                        
-                        if status == 'OK':
-                            raw_email = msg_data[0][1]
-                            email_message = email.message_from_bytes(raw_email)
-                            
-                            # 解析邮件信息
-                            email_obj = self._parse_email_to_model(email_id.decode('utf-8'), email_message)
-                            emails.append(email_obj)
-                        
-                        # 添加延迟避免请求过快
-                        time.sleep(0.1)
-                    except Exception as e:
-                        logger.error(f"获取邮件 {email_id} 时出错: {str(e)}")
-                        continue
-                
-                logger.info(f"成功获取 {len(emails)} 封新邮件")
-                return emails
-                
-            except Exception as e:
-                logger.error(f"获取新邮件时出错: {str(e)}")
+                search_criteria = f'(SINCE "{since.strftime("%d-%b-%Y")}")'
+            else:
+                # 如果没有指定时间，获取未读邮件
+                search_criteria = 'UNSEEN'
+            
+            status, message_ids = self.imap_connection.uid('search', None, search_criteria)
+            if status != 'OK':
+                logger.error("搜索邮件失败")
                 return []
-        else:
-            # 如果没有指定时间，获取未读邮件
-            return self.receive_emails(folder=folder_name, limit=10, unread_only=True)
\ No newline at end of file
+            
+            # N+1:* 在没有新邮件时仍会返回当前最大UID，需要再过滤一次
+            email_id_list = [uid for uid in message_ids[0].split() if int(uid) > last_uid]
+            
+            # 首次获取未读邮件时限制数量，与receive_emails保持一致
+            if not last_uid and not since:
+                email_id_list = email_id_list[-10:]
+            
+            logger.info(f"找到 {len(email_id_list)} 封新邮件")
+            
+            # 上次未能获取的邮件与新邮件一起重新获取
+            retry_ids = [uid.encode('utf-8') for uid in failed_uids if uid.encode('utf-8') not in email_id_list]
+            if retry_ids:
+                logger.info(f"重新获取 {len(retry_ids)} 封上次获取失败的邮件")
+            
+            if not email_id_list and not retry_ids:
+                return []
+            
+            # 批量获取邮件内容（从最新邮件开始），未指定时间时与未读邮件一样标记为已读
+            fetch_ids = sorted(retry_ids + email_id_list, key=int)
+            emails = self._fetch_emails(fetch_ids, mark_seen=since is None)
+            
+            # 最大UID推进到本次搜索到的最新邮件，未能获取或解析的邮件单独记录，下次检查时重试
+            fetched_ids = {email_obj.id for email_obj in emails}
+            failed_uids = self._count_failed_uids(
+                folder_name, failed_uids,
+                [uid.decode('utf-8') for uid in fetch_ids if uid.decode('utf-8') not in fetched_ids]
+            )
+            if email_id_list:
+                last_uid = max(last_uid, max(int(uid) for uid in email_id_list))
+            self._set_last_uid(folder_name, last_uid, uidvalidity, failed_uids)
+            
+            logger.info(f"成功获取 {len(emails)} 封新邮件")
+            return emails
+            
+        except Exception as e:
+            logger.error(f"获取新邮件时出错: {str(e)}")
+            return []
+    
+    def _load_uid_state(self) -> Dict[str, Dict[str, Any]]:
+        """从文件加载各文件夹已获取的最大UID和需要重试的邮件UID"""
+        if not os.path.exists(self.state_path):
+            return {}
+        
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"加载UID记录失败: {str(e)}")
+            return {}
+    
+    def _save_uid_state(self):
+        """保存各文件夹已获取的最大UID（先写临时文件再替换，避免写入中断损坏记录）"""
+        try:
+            state_dir = os.path.dirname(self.state_path)
+            if state_dir:
+                os.makedirs(state_dir, exist_ok=True)
+            
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._uid_state, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"保存UID记录失败: {str(e)}")
+    
+    def _current_uidvalidity(self) -> Optional[int]:
+        """读取最近一次SELECT返回的UIDVALIDITY（imaplib读取后即从响应缓存中移除，每次SELECT后只能读取一次）"""
+        try:
+            _, data = self.imap_connection.response('UIDVALIDITY')
+            if data and data[0]:
+                return int(data[0])
+        except Exception:
+            pass
+        return None
+    
+    def _get_last_uid(self, folder_name: str, uidvalidity: Optional[int]) -> int:
+        """获取文件夹已获取的最大UID，UIDVALIDITY变化（UID被服务器重新分配）时记录失效"""
+        state = self._uid_state.get(folder_name)
+        if not state:
+            return 0
+        
+        if uidvalidity is not None and state.get('uidvalidity') != uidvalidity:
+            logger.warning(f"文件夹 {folder_name} 的UIDVALIDITY已变化，重新开始获取")
+            self._uid_state.pop(folder_name, None)
+            self._save_uid_state()
+            return 0
+        
+        return state.get('last_uid', 0)
+    
+    def _get_failed_uids(self, folder_name: str) -> Dict[str, int]:
+        """获取文件夹中未能获取的邮件UID及已尝试的次数"""
+        return dict(self._uid_state.get(folder_name, {}).get('failed', {}))
+    
+    @staticmethod
+    def _count_failed_uids(folder_name: str, failed_uids: Dict[str, int], failed_now: List[str]) -> Dict[str, int]:
+        """记录本次未能获取的邮件UID的尝试次数，达到FAILED_UID_MAX_ATTEMPTS次的不再重试"""
+        counted = {}
+        for uid in failed_now:
+            attempts = failed_uids.get(uid, 0) + 1
+            if attempts >= FAILED_UID_MAX_ATTEMPTS:
+                logger.error(f"文件夹 {folder_name} 中的邮件 {uid} 已 {attempts} 次获取失败，不再重试")
+            else:
+                counted[uid] = attempts
+        return counted
+    
+    def _set_last_uid(self, folder_name: str, last_uid: int, uidvalidity: Optional[int],
+                      failed_uids: Optional[Dict[str, int]] = None):
+        """记录文件夹已获取的最大UID，以及其中未能获取、需要重试的邮件UID"""
+        self._uid_state[folder_name] = {
+            'uidvalidity': uidvalidity,
+            'last_uid': last_uid,
+            'failed': failed_uids or {}
+        }
+        self._save_uid_state()
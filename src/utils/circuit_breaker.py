@@ -0,0 +1,89 @@
+"""
+断路器
+外部服务（LLM、SMTP）连续失败达到阈值后，在一段时间内直接拒绝调用，避免服务故障期间逐项重试浪费时间和配额
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreakerOpenError(Exception):
+    """断路器处于打开状态，调用被拒绝"""
+
+
+class CircuitBreaker:
+    """
+    连续失败计数断路器
+
+    连续失败fail_max次后打开，reset_timeout秒内拒绝所有调用；超时后进入半开状态放行调用，
+    调用成功则关闭断路器，再次失败则重新打开并重新计时
+    """
+
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 60):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        """断路器是否打开（且尚未到达重试时间）"""
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow_request(self) -> bool:
+        """是否允许本次调用"""
+        return not self.is_open
+
+    def record_success(self):
+        """记录一次成功调用，关闭断路器"""
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"{self.name}服务已恢复，断路器关闭")
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """记录一次失败调用，连续失败达到阈值时打开断路器"""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.fail_max:
+                if self._opened_at is None:
+                    logger.warning(f"{self.name}服务连续失败 {self._failures} 次，断路器打开，"
+                                   f"{self.reset_timeout} 秒内跳过调用")
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """通过断路器调用fn，fn抛出异常视为失败；断路器打开时抛出CircuitBreakerOpenError"""
+        if not self.allow_request():
+            raise CircuitBreakerOpenError(f"{self.name}服务暂不可用（断路器已打开）")
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+
+        self.record_success()
+        return result
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """call的异步版本"""
+        if not self.allow_request():
+            raise CircuitBreakerOpenError(f"{self.name}服务暂不可用（断路器已打开）")
+
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+
+        self.record_success()
+        return result
@@ -0,0 +1,144 @@
+"""
+Embedding缓存
+按 (模型, 文本) 的SHA-256缓存embedding结果：查询向量保存在进程内LRU中，文档向量保存在磁盘上，
+重复的问题和重建向量数据库时内容未变的文本不再请求embedding服务
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import diskcache
+except ImportError:  # 未安装diskcache时只缓存查询向量
+    diskcache = None
+
+logger = logging.getLogger(__name__)
+
+# 进程内缓存的查询向量数量（以float32保存，4096维每条约16KB）
+QUERY_CACHE_SIZE = 1024
+
+
+def _as_float32(vectors) -> np.ndarray:
+    """
+    统一转为float32：OpenAI兼容接口返回的向量本身就是float32精度，以float32缓存不损失精度，
+    新计算的向量同样转换，保证命中缓存与否返回的结果完全一致
+    """
+    return np.asarray(vectors, dtype=np.float32)
+
+
+class CachedEmbeddings(Embeddings):
+    """带缓存的embedding模型，接口与被包装的模型一致，可直接用于FAISS和检索器"""
+
+    def __init__(self, underlying: Embeddings, namespace: str, cache_path: Optional[str] = None):
+        self.underlying = underlying
+        self.namespace = namespace
+
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._disk_cache = self._open_disk_cache(cache_path)
+
+    @staticmethod
+    def _open_disk_cache(cache_path: Optional[str]):
+        """打开磁盘上的文档向量缓存，不可用时返回None"""
+        if diskcache is None or not cache_path:
+            return None
+
+        try:
+            return diskcache.Cache(cache_path)
+        except Exception as e:
+            logger.error(f"打开embedding缓存失败: {str(e)}")
+            return None
+
+    def _key(self, kind: str, text: str) -> str:
+        """缓存键：模型名和文本的SHA-256，查询和文档分开缓存"""
+        digest = hashlib.sha256(f"{self.namespace}\0{text}".encode('utf-8')).hexdigest()
+        return f"{kind}:{digest}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """计算文档向量，只为缓存中没有的文本请求embedding服务（一次请求）"""
+        keys = [self._key('doc', text) for text in texts]
+        vectors = [self._disk_get(key) for key in keys]
+
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = _as_float32(self.underlying.embed_documents([texts[index] for index in missing]))
+            for index, array in zip(missing, computed):
+                vectors[index] = array.tolist()
+                self._disk_set(keys[index], array)
+
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """embed_documents的异步版本"""
+        keys = [self._key('doc', text) for text in texts]
+        vectors = [self._disk_get(key) for key in keys]
+
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = _as_float32(await self.underlying.aembed_documents([texts[index] for index in missing]))
+            for index, array in zip(missing, computed):
+                vectors[index] = array.tolist()
+                self._disk_set(keys[index], array)
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """计算查询向量，相同问题直接返回缓存结果"""
+        key = self._key('query', text)
+        vector = self._query_get(key)
+        if vector is None:
+            array = _as_float32(self.underlying.embed_query(text))
+            self._query_set(key, array)
+            vector = array.tolist()
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """embed_query的异步版本"""
+        key = self._key('query', text)
+        vector = self._query_get(key)
+        if vector is None:
+            array = _as_float32(await self.underlying.aembed_query(text))
+            self._query_set(key, array)
+            vector = array.tolist()
+        return vector
+
+    def _query_get(self, key: str) -> Optional[List[float]]:
+        with self._query_cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is None:
+                return None
+            self._query_cache.move_to_end(key)
+        return vector.tolist()
+
+    def _query_set(self, key: str, array: np.ndarray):
+        with self._query_cache_lock:
+            self._query_cache[key] = array
+            self._query_cache.move_to_end(key)
+            if len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        if self._disk_cache is None:
+            return None
+
+        try:
+            data = self._disk_cache.get(key)
+        except Exception as e:
+            logger.warning(f"读取embedding缓存失败: {str(e)}")
+            return None
+        return np.frombuffer(data, dtype=np.float32).tolist() if data is not None else None
+
+    def _disk_set(self, key: str, array: np.ndarray):
+        if self._disk_cache is None:
+            return
+
+        try:
+            self._disk_cache.set(key, array.tobytes())
+        except Exception as e:
+            logger.warning(f"写入embedding缓存失败: {str(e)}")
@@ -0,0 +1,69 @@
+"""
+共享HTTP客户端
+LLM和embedding请求共用同一组连接池，复用TCP/TLS连接；安装了h2时启用HTTP/2，多个请求复用同一条连接
+"""
+
+import logging
+import threading
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # 未安装h2时使用HTTP/1.1 keep-alive
+    HTTP2_AVAILABLE = False
+
+# 请求超时：LLM生成可能较慢，连接超时则应尽快失败
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# 连接池大小
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.Client:
+    """获取共享的同步HTTP客户端（线程安全，首次调用时创建）"""
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(http2=HTTP2_AVAILABLE, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+            logger.info(f"创建共享HTTP客户端，HTTP/2: {'启用' if HTTP2_AVAILABLE else '未启用'}")
+        return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    获取共享的异步HTTP客户端（首次调用时创建）
+
+    异步客户端的连接绑定在首次使用它的事件循环上，调用方应在同一个长期存在的事件循环中使用
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        return _async_client
+
+
+def close_http_client():
+    """关闭共享的同步HTTP客户端"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose_async_http_client():
+    """关闭共享的异步HTTP客户端（需在使用它的事件循环中调用）"""
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,14 @@
+"""
+进程池
+主进程中运行着通知线程、IMAP保活线程和HTTP客户端的线程，在多线程进程中fork子进程可能继承被其他线程持有的锁
+（如logging、SSL），导致子进程死锁；因此进程池使用forkserver（不支持时使用spawn）启动子进程
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def create_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """创建不通过fork启动子进程的进程池，子进程在首次提交任务时启动"""
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
@@ -0,0 +1,87 @@
+"""
+LLM请求限速
+按服务商的每分钟请求数（RPM）和每分钟token数（TPM）限制对LLM请求进行平滑，避免并发请求集中触发429
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    令牌桶（线程安全）
+
+    每分钟补充rate_per_minute个令牌，桶容量同样为rate_per_minute。取令牌采用预约方式：
+    令牌不足时先扣成负数并返回需要等待的时间，因此同步线程和不同事件循环中的协程可以共用同一个桶。
+    rate_per_minute为0表示不限速
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = self.capacity / 60.0
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def reserve(self, amount: float = 1) -> float:
+        """预约amount个令牌，返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+
+        # 单次请求超过桶容量时按容量计算，否则永远无法满足
+        amount = min(amount, self.capacity)
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class LLMRateLimiter:
+    """同时限制RPM和TPM的LLM请求限速器"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+
+    def _reserve(self, tokens: int) -> float:
+        return max(self._requests.reserve(1), self._tokens.reserve(tokens))
+
+    def acquire(self, tokens: int = 0):
+        """发起一次预计消耗tokens个token的请求前调用，必要时阻塞等待"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.debug(f"LLM请求限速，等待 {wait:.2f} 秒")
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """acquire的异步版本，等待期间不阻塞事件循环"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.debug(f"LLM请求限速，等待 {wait:.2f} 秒")
+            await asyncio.sleep(wait)
+
+
+_lock = threading.Lock()
+_llm_rate_limiter: Optional[LLMRateLimiter] = None
+
+
+def get_llm_rate_limiter() -> LLMRateLimiter:
+    """获取进程内共享的LLM限速器（首次调用时按配置创建）"""
+    global _llm_rate_limiter
+    with _lock:
+        if _llm_rate_limiter is None:
+            _llm_rate_limiter = LLMRateLimiter(Config.LLM_RPM, Config.LLM_TPM)
+        return _llm_rate_limiter
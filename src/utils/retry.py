@@ -0,0 +1,137 @@
+"""
+重试工具
+为调用外部API（embedding、LLM等）提供指数退避+随机抖动的重试
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 视为临时错误、值得重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _get_status_code(error: Exception) -> Optional[int]:
+    """从异常中提取HTTP状态码（兼容openai和requests的异常）"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        response = getattr(error, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+    return status_code
+
+
+def _get_retry_after(error: Exception) -> Optional[float]:
+    """读取响应中的Retry-After头（秒）"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after = headers.get('Retry-After')
+    if retry_after is None:
+        return None
+
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断异常是否为临时错误（限流、5xx、连接错误、超时）"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    status_code = _get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+
+    # openai / httpx / requests 的连接与超时异常没有状态码，按类名识别
+    error_name = type(error).__name__
+    return error_name in (
+        'APIConnectionError',
+        'APITimeoutError',
+        'ConnectError',
+        'ConnectTimeout',
+        'ReadTimeout',
+        'Timeout',
+    )
+
+
+def compute_backoff(attempt: int, base_delay: float, max_delay: float,
+                    error: Optional[Exception] = None) -> float:
+    """
+    计算第attempt次重试前的等待时间
+
+    优先使用服务端返回的Retry-After，否则使用指数退避并加上最多50%的随机抖动，
+    避免大量客户端在服务恢复时同时重试。
+    """
+    if error is not None:
+        retry_after = _get_retry_after(error)
+        if retry_after is not None:
+            return min(max_delay, retry_after)
+
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return delay * (1 + random.random() * 0.5)
+
+
+def retry_call(fn: Callable[..., Any], *args, max_retries: int = 3, base_delay: float = 1.0,
+               max_delay: float = 30.0, **kwargs) -> Any:
+    """
+    调用fn，遇到临时错误时按指数退避重试
+
+    Args:
+        fn: 要调用的函数
+        max_retries (int): 最大重试次数（不含首次调用）
+        base_delay (float): 首次重试的基础等待时间（秒）
+        max_delay (float): 单次等待时间上限（秒）
+
+    Returns:
+        fn的返回值；重试耗尽或遇到非临时错误时抛出最后一次的异常
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+
+            delay = compute_backoff(attempt, base_delay, max_delay, e)
+            logger.warning(f"调用 {getattr(fn, '__name__', fn)} 失败，{delay:.1f} 秒后重试 "
+                           f"({attempt + 1}/{max_retries}): {str(e)}")
+            time.sleep(delay)
+            attempt += 1
+
+
+async def aretry_call(fn: Callable[..., Awaitable[Any]], *args, max_retries: int = 3, base_delay: float = 1.0,
+                      max_delay: float = 30.0, **kwargs) -> Any:
+    """
+    retry_call的异步版本：await fn(...)，遇到临时错误时按指数退避重试，等待期间不阻塞事件循环
+
+    Args:
+        fn: 返回协程的函数（如chain.ainvoke）
+        max_retries (int): 最大重试次数（不含首次调用）
+        base_delay (float): 首次重试的基础等待时间（秒）
+        max_delay (float): 单次等待时间上限（秒）
+
+    Returns:
+        fn的返回值；重试耗尽或遇到非临时错误时抛出最后一次的异常
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+
+            delay = compute_backoff(attempt, base_delay, max_delay, e)
+            logger.warning(f"调用 {getattr(fn, '__name__', fn)} 失败，{delay:.1f} 秒后重试 "
+                           f"({attempt + 1}/{max_retries}): {str(e)}")
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,133 @@
+"""
+SMTP连接池
+维护少量已登录的SMTP连接供多个线程并发发送邮件；每条连接发送一定数量的邮件后重建，遵守服务器对单连接的发送上限
+"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 连接空闲超过该时间（秒）后，复用前先发送NOOP确认连接仍然可用
+HEALTHCHECK_IDLE_SECONDS = 30
+
+
+class PooledSMTPConnection:
+    """连接池中的一条SMTP连接"""
+
+    __slots__ = ('server', 'messages_sent', 'last_used')
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """
+    有界SMTP连接池（线程安全）
+
+    最多同时存在max_size条连接，连接用尽时acquire阻塞等待；空闲连接放在队列中复用，
+    发送数达到max_messages_per_connection的连接在归还时关闭，下次需要时重新建立
+    """
+
+    def __init__(self, connect: Callable[[], smtplib.SMTP], max_size: int = 5,
+                 max_messages_per_connection: int = 100):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_messages_per_connection = max_messages_per_connection
+
+        self._idle: 'queue.Queue[PooledSMTPConnection]' = queue.Queue(maxsize=max_size)
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def acquire(self) -> PooledSMTPConnection:
+        """借出一条可用连接，没有空闲连接时新建"""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return PooledSMTPConnection(self._connect())
+
+                if self._is_healthy(conn):
+                    return conn
+                self._quit(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: PooledSMTPConnection, reuse: bool = True):
+        """
+        归还连接
+
+        Args:
+            conn: acquire借出的连接
+            reuse: 连接状态是否正常；发送出错时传False，连接会被关闭而不是放回池中
+        """
+        try:
+            if reuse and conn.messages_sent < self.max_messages_per_connection:
+                conn.last_used = time.monotonic()
+                self._idle.put_nowait(conn)
+            else:
+                if reuse:
+                    logger.info(f"SMTP连接已发送 {conn.messages_sent} 封邮件，关闭后重建")
+                self._quit(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """关闭所有空闲连接（借出中的连接在归还后按正常流程处理）"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(conn)
+
+    @staticmethod
+    def _is_healthy(conn: PooledSMTPConnection) -> bool:
+        """最近使用过的连接直接复用，空闲较久的连接用NOOP检查"""
+        if time.monotonic() - conn.last_used < HEALTHCHECK_IDLE_SECONDS:
+            return True
+
+        try:
+            code, _ = conn.server.noop()
+        except (smtplib.SMTPException, OSError) as e:
+            logger.info(f"SMTP连接已断开，重新连接: {str(e)}")
+            return False
+
+        if code != 250:
+            logger.info(f"SMTP连接状态异常（NOOP返回 {code}），重新连接")
+            return False
+        return True
+
+    @staticmethod
+    def _quit(conn: PooledSMTPConnection):
+        try:
+            conn.server.quit()
+        except Exception:
+            try:
+                conn.server.close()
+            except Exception:
+                pass
+
+
+_pools_lock = threading.Lock()
+_pools: Dict[Tuple[str, int, str], SMTPConnectionPool] = {}
+
+
+def get_smtp_pool(server: str, port: int, username: str, connect: Callable[[], smtplib.SMTP],
+                  max_size: int = 5, max_messages_per_connection: int = 100) -> SMTPConnectionPool:
+    """获取按(服务器, 端口, 用户名)共享的连接池，同一账号的多个客户端共用连接"""
+    key = (server, port, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPConnectionPool(connect, max_size, max_messages_per_connection)
+            _pools[key] = pool
+        return pool
@@ -0,0 +1,271 @@
+"""
+向量数据库持久化
+FAISS索引单独写入index.faiss，文档内容和元数据保存在SQLite中：启动时不再反序列化整个pickle文档库，
+检索时只读取命中的文档；增量添加的文档只写入新增部分，不再重写全部文档
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import warnings
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import faiss
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.faiss'
+DOCSTORE_FILE = 'docstore.sqlite'
+
+# 旧版本FAISS.save_local保存的pickle文档库，首次加载时迁移到SQLite
+LEGACY_DOCSTORE_FILE = 'index.pkl'
+
+# GPU资源（显存池等），首次迁移索引时创建，需在GPU索引的整个生命周期内保持
+_gpu_resources = None
+
+
+def _dumps_metadata(metadata: Dict) -> str:
+    """序列化文档元数据（非ASCII字符不转义）"""
+    if orjson is not None:
+        return orjson.dumps(metadata).decode('utf-8')
+    return json.dumps(metadata, ensure_ascii=False)
+
+
+def _loads_metadata(data: str) -> Dict:
+    """反序列化文档元数据"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    基于SQLite的文档库（线程安全）
+
+    新增的文档在save_vector_store保存索引时才提交，未提交前同一连接的检索可以读到，
+    进程异常退出时回滚，与磁盘上的索引文件保持一致
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents '
+            '(id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL)'
+        )
+        # FAISS向量序号到文档ID的映射
+        self._conn.execute('CREATE TABLE IF NOT EXISTS index_map (row INTEGER PRIMARY KEY, doc_id TEXT NOT NULL)')
+        self._conn.commit()
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """添加文档（id -> 文档）"""
+        rows = [
+            (doc_id, doc.page_content, _dumps_metadata(doc.metadata))
+            for doc_id, doc in texts.items()
+        ]
+        with self._lock:
+            try:
+                self._conn.executemany('INSERT INTO documents VALUES (?, ?, ?)', rows)
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Tried to add ids that already exist: {str(e)}")
+
+    def delete(self, ids: List) -> None:
+        """删除文档"""
+        with self._lock:
+            self._conn.executemany('DELETE FROM documents WHERE id = ?', [(doc_id,) for doc_id in ids])
+
+    def search(self, search: str) -> Union[str, Document]:
+        """按ID读取文档，不存在时返回错误信息（与InMemoryDocstore一致）"""
+        with self._lock:
+            row = self._conn.execute('SELECT content, metadata FROM documents WHERE id = ?', (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=_loads_metadata(row[1]))
+
+    def count(self) -> int:
+        """文档数量"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def email_count(self) -> int:
+        """文档所属的不同邮件数量（一封邮件可能被分割为多个文档）"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(DISTINCT json_extract(metadata, '$.email_id')) FROM documents"
+            ).fetchone()[0]
+
+    def email_counts_by(self, field: str) -> Dict[Optional[str], int]:
+        """按元数据字段（如category、importance）分组统计邮件数量，在SQLite中聚合，无需读出每个文档"""
+        path = f'$.{field}'
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT json_extract(metadata, ?), COUNT(DISTINCT json_extract(metadata, '$.email_id')) "
+                "FROM documents WHERE json_extract(metadata, '$.email_id') IS NOT NULL GROUP BY 1",
+                (path,)
+            ).fetchall()
+        return dict(rows)
+
+    def load_index_map(self, ntotal: int) -> Dict[int, str]:
+        """读取向量序号到文档ID的映射，只保留索引中实际存在的向量"""
+        with self._lock:
+            rows = self._conn.execute('SELECT row, doc_id FROM index_map WHERE row < ?', (ntotal,)).fetchall()
+        return dict(rows)
+
+    def save_index_map(self, index_to_docstore_id: Dict[int, str]):
+        """
+        写入向量序号到文档ID的映射：只追加新增的序号；
+        映射变短（删除过向量，序号重新排列）时整体重写
+        """
+        with self._lock:
+            stored = self._conn.execute('SELECT COUNT(*) FROM index_map').fetchone()[0]
+            if stored > len(index_to_docstore_id):
+                self._conn.execute('DELETE FROM index_map')
+                stored = 0
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO index_map VALUES (?, ?)',
+                [(row, doc_id) for row, doc_id in index_to_docstore_id.items() if row >= stored]
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """关闭连接，未提交的修改回滚"""
+        with self._lock:
+            self._conn.close()
+
+
+def _export_docstore(vector_store: FAISS, db_path: Path) -> SQLiteDocstore:
+    """将内存中的文档库（新建或重建的向量数据库）整体写入SQLite，并替换为SQLiteDocstore释放内存"""
+    docstore = SQLiteDocstore(str(db_path))
+    with docstore._lock:
+        docstore._conn.execute('DELETE FROM documents')
+        docstore._conn.execute('DELETE FROM index_map')
+
+    documents = {}
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            documents[doc_id] = doc
+    docstore.add(documents)
+
+    vector_store.docstore = docstore
+    return docstore
+
+
+def save_vector_store(vector_store: FAISS, folder_path: str):
+    """
+    保存向量数据库：先提交文档和映射，再写入索引文件
+
+    中途失败时磁盘上的映射可能比索引多出若干条，加载时按索引实际的向量数截断即可
+    """
+    path = Path(folder_path)
+    path.mkdir(parents=True, exist_ok=True)
+    db_path = path / DOCSTORE_FILE
+
+    docstore = vector_store.docstore
+    if not (isinstance(docstore, SQLiteDocstore) and Path(docstore.path) == db_path):
+        docstore = _export_docstore(vector_store, db_path)
+
+    docstore.save_index_map(vector_store.index_to_docstore_id)
+    docstore.commit()
+
+    # 先写临时文件再替换，避免写入中断时留下损坏的索引文件；GPU索引先复制回CPU再写入
+    tmp_path = path / f"{INDEX_FILE}.tmp"
+    faiss.write_index(_cpu_index(vector_store.index), str(tmp_path))
+    os.replace(tmp_path, path / INDEX_FILE)
+
+
+def load_vector_store(folder_path: str, embeddings: Embeddings) -> Optional[FAISS]:
+    """加载向量数据库，不存在时返回None；旧版本的pickle文档库在首次加载时迁移到SQLite"""
+    path = Path(folder_path)
+    index_path = path / INDEX_FILE
+    if not index_path.exists():
+        return None
+
+    db_path = path / DOCSTORE_FILE
+    if not db_path.exists() and (path / LEGACY_DOCSTORE_FILE).exists():
+        logger.info("将向量数据库的文档库从pickle迁移到SQLite")
+        vector_store = FAISS.load_local(folder_path, embeddings, allow_dangerous_deserialization=True)
+        save_vector_store(vector_store, folder_path)
+        return vector_store
+
+    index = faiss.read_index(str(index_path))
+    docstore = SQLiteDocstore(str(db_path))
+    return create_vector_store(embeddings, index, docstore, docstore.load_index_map(index.ntotal))
+
+
+def create_vector_store(embeddings: Embeddings, index: faiss.Index, docstore: Docstore,
+                        index_to_docstore_id: Dict[int, str]) -> FAISS:
+    """
+    按索引的度量创建FAISS向量数据库：内积索引中保存的是归一化后的向量（余弦相似度），
+    写入和查询的向量同样需要归一化；旧的L2索引保持原样
+    """
+    inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    with warnings.catch_warnings():
+        # LangChain对“内积度量+归一化”组合的提示不适用于余弦相似度，归一化仍然生效
+        warnings.filterwarnings('ignore', message='Normalizing L2 is not applicable')
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            normalize_L2=inner_product,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT if inner_product else DistanceStrategy.EUCLIDEAN_DISTANCE
+        )
+
+
+def gpu_available() -> bool:
+    """当前安装的是faiss-gpu且检测到CUDA设备"""
+    return hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0
+
+
+def move_index_to_gpu(vector_store: FAISS) -> bool:
+    """
+    将索引迁移到第一块GPU上检索（暴力检索受内存带宽限制，显存带宽高一个数量级），向量以fp16保存在显存中；
+    不支持GPU的索引类型（如fp16标量量化的暴力检索索引）继续在CPU上检索
+    """
+    global _gpu_resources
+    if not gpu_available():
+        return False
+
+    try:
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        options = faiss.GpuClonerOptions()
+        options.useFloat16 = True
+        vector_store.index = faiss.index_cpu_to_gpu(_gpu_resources, 0, vector_store.index, options)
+        logger.info("向量索引已迁移到GPU")
+        return True
+    except Exception as e:
+        logger.warning(f"向量索引无法迁移到GPU，继续使用CPU检索: {str(e)}")
+        return False
+
+
+def _cpu_index(index: faiss.Index) -> faiss.Index:
+    """GPU索引复制为CPU索引（用于保存），CPU索引原样返回"""
+    if gpu_available() and type(index).__name__.startswith('Gpu'):
+        return faiss.index_gpu_to_cpu(index)
+    return index
+
+
+def close_vector_store(vector_store: Optional[FAISS]):
+    """关闭向量数据库的文档库连接（未保存的新增文档随之丢弃）"""
+    if vector_store is not None and isinstance(vector_store.docstore, SQLiteDocstore):
+        vector_store.docstore.close()